@@ -1,14 +1,28 @@
 import eventlet
 eventlet.monkey_patch(os=False)
 
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, leave_room, emit
 from routes.auth import auth_bp
-from routes.user import user_bp
+from routes.user import user_bp, user_profile_cache
 from models.database import init_db, get_db
+from utils import wire
+from utils.auth import authenticate_socket, forget_socket, init_auth, socket_user_id, token_cache
+from utils.responses import init_responses, socketio_options
+from utils.sessions import registry
+from models.profile import profile_cache
+from utils.rate_limit import limiter, socket_rate_limit
+from services import presence, archive_service, photo_store, ai_service, ai_cache
+from services.notification_service import NotificationService, transport_from_env
+from services import jobs  # noqa: F401 (registers job handlers)
+from services.job_queue import JobWorker, stats as job_stats
+from services.ai_service import DailyMatchAI
+from models import profile_content
+from utils.photo_urls import photo_url
 import os
 import random
+import threading
 import time
 
 app = Flask(__name__)
@@ -25,7 +39,23 @@ except Exception as e:
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', **socketio_options())
+
+# Notifications for recipients who aren't in the chat room
+notifications = NotificationService(transport_from_env())
+notifications.start()
+
+# Background jobs also run in here unless JOB_WORKERS=0 (then run worker.py)
+job_worker = JobWorker(workers=int(os.environ.get('JOB_WORKERS', 1)))
+if job_worker.workers:
+    job_worker.start()
+
+# Resolve the bearer token once per request for every blueprint
+init_auth(app)
+
+# orjson-backed jsonify + gzip/brotli for larger responses
+init_responses(app)
+photo_store.init_uploads(app)
 
 # Register Blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -39,74 +69,254 @@ def index():
 def health():
     return {'status': 'ok'}
 
+@app.route('/api/metrics')
+def metrics():
+    return {
+        'rate_limit': limiter.stats(),
+        'token_cache': token_cache.stats(),
+        'sessions': registry.stats(),
+        'profile_cache': profile_cache.stats(),
+        'user_profile_cache': user_profile_cache.stats(),
+        'photos': photo_store.stats(),
+        'jobs': job_stats(),
+        'ai': ai_service.stats(),
+        'ai_cache': ai_cache.stats(),
+    }
+
 # --- Socket.IO Events ---
 
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    # Opt-in compact encoding, e.g. io(url, { auth: { encoding: 'compact' } })
+    requested = (auth or {}).get('encoding') or request.args.get('encoding')
+    encoding = wire.negotiate(request.sid, requested)
+    # Identity for events that act on the caller's behalf, e.g. io(url, { auth: { token } })
+    user_id = authenticate_socket(request.sid, auth)
+    print(f'Client connected ({encoding}, user {user_id})')
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    wire.forget(request.sid)
+    forget_socket(request.sid)
+    presence.disconnected(request.sid)
+    # Stop generations nobody is waiting for
+    for cancel in _ai_streams.pop(request.sid, {}).values():
+        cancel.set()
     print('Client disconnected')
 
+# Reconnecting clients with more than this many unseen messages get the latest
+# page instead of a delta, and page further back with 'load_history'.
+DELTA_SYNC_LIMIT = int(os.environ.get('DELTA_SYNC_LIMIT', 200))
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+
+PAIR_FILTER = '''
+    ((sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?))
+'''
+
+IMAGE_PREFIX = '[IMAGE]:'
+
+def _image_url(text):
+    """Signed feed URL for an image message ("[IMAGE]:<ref>"), else None"""
+    if text and text.startswith(IMAGE_PREFIX):
+        return photo_url(text[len(IMAGE_PREFIX):], 'feed')
+    return None
+
+def _serialize_message(row):
+    return {
+        '_id': str(row['id']), # Unique ID
+        'text': row['text'],
+        'senderId': str(row['sender_id']),
+        'timestamp': row['created_at'],
+        'status': 'read' if row['read'] else 'sent',
+        'imageUrl': _image_url(row['text']),
+    }
+
+def _get_match_users(cursor, room):
+    cursor.execute("SELECT user1_id, user2_id FROM matches WHERE id = ?", (room,))
+    match_row = cursor.fetchone()
+    if not match_row:
+        return None
+    return match_row['user1_id'], match_row['user2_id']
+
+def _fetch_page(cursor, user1, user2, before_id=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Latest `limit` messages older than before_id, oldest first, plus a has-more flag.
+    Reads through to the archive once the hot table runs out.
+    """
+    query = f"SELECT * FROM messages WHERE {PAIR_FILTER}"
+    params = [user1, user2, user2, user1]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not has_more:
+        oldest_id = rows[-1]['id'] if rows else before_id
+        archived, has_more = archive_service.read_archived(user1, user2, oldest_id, limit - len(rows))
+        rows = list(rows) + archived
+    rows.reverse()
+    return [_serialize_message(row) for row in rows], has_more
+
+def _build_delta(cursor, user1, user2, last_id):
+    """
+    Messages newer than last_id plus the read watermark per sender.
+    Returns None when the gap is too large for a delta.
+    """
+    cursor.execute(f'''
+        SELECT * FROM messages
+        WHERE {PAIR_FILTER} AND id > ?
+        ORDER BY id ASC LIMIT ?
+    ''', (user1, user2, user2, user1, last_id, DELTA_SYNC_LIMIT + 1))
+    rows = cursor.fetchall()
+    if len(rows) > DELTA_SYNC_LIMIT:
+        return None
+
+    # Read receipts only ever move forward, so the highest read id per
+    # sender is enough for the client to update every older message.
+    cursor.execute(f'''
+        SELECT sender_id, MAX(id) AS read_up_to FROM messages
+        WHERE {PAIR_FILTER} AND read = 1
+        GROUP BY sender_id
+    ''', (user1, user2, user2, user1))
+    read_up_to = {str(r['sender_id']): str(r['read_up_to']) for r in cursor.fetchall()}
+
+    return {
+        'messages': [_serialize_message(row) for row in rows],
+        'readUpTo': read_up_to,
+    }
+
+def _authorize_room(cursor, room):
+    """The room's two participants if the authenticated caller is one of them, else None"""
+    user_id = socket_user_id(request.sid)
+    users = _get_match_users(cursor, room)
+    if user_id is None or not users or user_id not in users:
+        print(f"DEBUG: Refused room {room} to user {user_id}")
+        emit('chat_error', {'room': room, 'error': 'Match not found'})
+        return None
+    return users
+
 @socketio.on('join')
 def on_join(data):
     room = data.get('room')
     if room:
+        # Only the two people in the match may join its room or read its history
+        conn = get_db()
+        cursor = conn.cursor()
+        users = _authorize_room(cursor, room)
+        if not users:
+            conn.close()
+            return
+
+        encoding = wire.encoding_for(request.sid)
         join_room(room)
+        join_room(wire.room_for(room, encoding))
         print(f'Client joined room: {room}')
+
+        # The verified caller (checked above), not the client's userId
+        user_id = socket_user_id(request.sid)
+        presence.joined(request.sid, room, user_id)
+        notifications.cancel_pending(user_id, room)
         
         # Load Chat History
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            
-            print(f"DEBUG: Looking for match/room ID: {room}")
-            # Find the users in this match/room
-            cursor.execute("SELECT user1_id, user2_id FROM matches WHERE id = ?", (room,))
-            match_row = cursor.fetchone()
-            
-            if match_row:
-                user1, user2 = match_row['user1_id'], match_row['user2_id']
-                print(f"DEBUG: Found match between {user1} and {user2}")
-                
-                # Fetch messages between them
-                cursor.execute('''
-                    SELECT * FROM messages 
-                    WHERE (sender_id = ? AND receiver_id = ?) 
-                       OR (sender_id = ? AND receiver_id = ?)
-                    ORDER BY created_at ASC
-                ''', (user1, user2, user2, user1))
-                
-                rows = cursor.fetchall()
-                print(f"DEBUG: Loading {len(rows)} messages from history")
-                
-                history = []
-                for row in rows:
-                    history.append({
-                        '_id': str(row['id']), # Unique ID
-                        'text': row['text'],
-                        'senderId': str(row['sender_id']),
-                        'timestamp': row['created_at'],
-                        'status': 'read' if row['read'] else 'sent'
-                    })
-                
-                emit('chat_history', history, room=room)
+            user1, user2 = users
+            print(f"DEBUG: Found match between {user1} and {user2}")
+
+            # Reconnecting clients tell us the newest message they have
+            last_id = data.get('lastMessageId')
+            try:
+                last_id = int(last_id) if last_id is not None else None
+            except (TypeError, ValueError):
+                last_id = None
+
+            delta = _build_delta(cursor, user1, user2, last_id) if last_id is not None else None
+
+            if delta is not None:
+                print(f"DEBUG: Sending delta of {len(delta['messages'])} messages")
+                emit('chat_delta', wire.encode_batch(delta, encoding))
             else:
-                 print(f"DEBUG: No match found for room {room}")
-                
-            conn.close()
+                # First join, or a gap too large for a delta: the latest page
+                # (reading through to the archive), older ones via 'load_history'
+                history, has_more = _fetch_page(cursor, user1, user2)
+                print(f"DEBUG: Loading latest {len(history)} messages from history")
+                emit('chat_history', wire.encode_messages(history, encoding))
+                emit('chat_history_page', wire.encode_batch({'messages': [], 'hasMore': has_more}, encoding))
         except Exception as e:
             print(f"Error loading history: {e}")
+        finally:
+            conn.close()
+
+@socketio.on('load_history')
+def on_load_history(data):
+    """Page further back through a conversation, HISTORY_PAGE_SIZE at a time."""
+    room = data.get('room')
+    if not room:
+        return
+
+    try:
+        before_id = int(data['beforeId']) if data.get('beforeId') is not None else None
+    except (TypeError, ValueError):
+        before_id = None
+
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        users = _authorize_room(cursor, room)
+        if users:
+            messages, has_more = _fetch_page(cursor, users[0], users[1], before_id)
+            payload = {'messages': messages, 'hasMore': has_more}
+            emit('chat_history_page', wire.encode_batch(payload, wire.encoding_for(request.sid)))
+        conn.close()
+    except Exception as e:
+        print(f"Error loading history page: {e}")
+
+@socketio.on('message_read')
+def on_message_read(data):
+    room = data.get('room')
+    message_id = data.get('messageId')
+    user_id = socket_user_id(request.sid)
+    if not room or not message_id or user_id is None:
+        return
+
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        # Only the room's participants, and only for messages they received
+        users = _get_match_users(cursor, room)
+        if not users or user_id not in users:
+            conn.close()
+            return
+        other_id = users[1] if users[0] == user_id else users[0]
+        # Mark everything up to this message from the other participant as read
+        cursor.execute(f'''
+            UPDATE messages SET read = 1
+            WHERE id <= ? AND read = 0 AND {PAIR_FILTER}
+              AND receiver_id = ?
+        ''', (message_id, other_id, user_id, user_id, other_id, user_id))
+        marked = cursor.rowcount
+        conn.commit()
+        conn.close()
+        if marked:
+            emit('message_read', {'messageId': str(message_id)}, room=room, include_self=False)
+    except Exception as e:
+        print(f"Error marking message read: {e}")
 
 @socketio.on('leave')
 def on_leave(data):
     room = data.get('room')
     if room:
         leave_room(room)
+        leave_room(wire.room_for(room, wire.encoding_for(request.sid)))
+        presence.left(request.sid, room)
         print(f'Client left room: {room}')
 
 @socketio.on('send_message')
+@socket_rate_limit('send_message')
 def handle_message(data):
     room = data.get('room')
     message_text = data.get('text')
@@ -121,11 +331,10 @@ def handle_message(data):
             cursor = conn.cursor()
             
             # Identify receiver (the other person in the match)
-            cursor.execute("SELECT user1_id, user2_id FROM matches WHERE id = ?", (room,))
-            match_row = cursor.fetchone()
+            users = _get_match_users(cursor, room)
             
-            if match_row:
-                u1, u2 = match_row['user1_id'], match_row['user2_id']
+            if users:
+                u1, u2 = users
                 receiver_id = u2 if str(u1) == str(sender_id) else u1
                 
                 print(f"DEBUG: Saving msg from {sender_id} to {receiver_id}")
@@ -139,13 +348,20 @@ def handle_message(data):
                 new_msg_id = cursor.lastrowid
                 print(f"DEBUG: Msg saved with ID {new_msg_id}")
                 
-                # Emit to room
-                emit('receive_message', {
+                # Emit to room, encoded once per negotiated format
+                message = {
                     '_id': str(new_msg_id),
                     'text': message_text,
                     'senderId': sender_id,
-                    'timestamp': data.get('timestamp')
-                }, room=room)
+                    'timestamp': data.get('timestamp'),
+                    'imageUrl': _image_url(message_text),
+                }
+                for encoding in wire.ENCODINGS:
+                    emit('receive_message', wire.encode_message(message, encoding),
+                         room=wire.room_for(room, encoding))
+
+                if not presence.is_in_room(room, receiver_id):
+                    notifications.enqueue_message(receiver_id, room, sender_id, message_text)
             else:
                 print(f"DEBUG: Cannot save message, room {room} not found in DB")
                 
@@ -153,6 +369,98 @@ def handle_message(data):
         except Exception as e:
             print(f"Error saving message: {e}")
 
+# --- AI (streamed over the socket) ---
+
+# Tokens are sent as they arrive, at most one 'ai_token' per this many seconds
+AI_STREAM_FLUSH = float(os.environ.get('AI_STREAM_FLUSH', 0.05))
+
+ai = DailyMatchAI()
+# {sid: {requestId: cancel Event}} for generations in flight
+_ai_streams = {}
+
+def _stream_ai(result_event, request_id, generate):
+    """
+    Run generate(on_token, cancelled), sending partial text as 'ai_token'
+    {requestId, text} and the final result as result_event. The first token
+    goes out immediately; later ones are batched per AI_STREAM_FLUSH.
+    """
+    sid = request.sid
+    cancel = threading.Event()
+    _ai_streams.setdefault(sid, {})[request_id] = cancel
+    pending = []
+    last_flush = [0.0]
+
+    # Tokens may arrive on another caller's thread when an identical prompt is
+    # shared (services/ai_scheduler.py), so address this client explicitly
+    def flush():
+        if pending:
+            socketio.emit('ai_token', {'requestId': request_id, 'text': ''.join(pending)}, to=sid)
+            pending.clear()
+        last_flush[0] = time.monotonic()
+
+    def on_token(token):
+        pending.append(token)
+        if time.monotonic() - last_flush[0] >= AI_STREAM_FLUSH:
+            flush()
+
+    try:
+        result = generate(on_token, cancel.is_set)
+    finally:
+        streams = _ai_streams.get(sid, {})
+        streams.pop(request_id, None)
+        if not streams:
+            _ai_streams.pop(sid, None)
+
+    if not cancel.is_set():
+        flush()
+        socketio.emit(result_event, {'requestId': request_id, **result}, to=sid)
+
+@socketio.on('ai_improve_answer')
+@socket_rate_limit('ai')
+def on_ai_improve_answer(data):
+    request_id = data.get('requestId')
+    question = data.get('question')
+    answer = data.get('answer')
+    if not question or not answer:
+        emit('ai_error', {'requestId': request_id, 'error': 'question and answer are required'})
+        return
+
+    _stream_ai('ai_improved_answer', request_id, lambda on_token, cancelled: {
+        'improved': ai.improve_prompt_answer(question, answer, on_token=on_token, cancelled=cancelled)
+    })
+
+@socketio.on('ai_icebreakers')
+@socket_rate_limit('ai')
+def on_ai_icebreakers(data):
+    request_id = data.get('requestId')
+    room = data.get('room')
+    # The authenticated caller, never a client-supplied id: the prompt includes the other profile
+    user_id = socket_user_id(request.sid)
+    if user_id is None:
+        emit('ai_error', {'requestId': request_id, 'error': 'Authentication required'})
+        return
+
+    conn = get_db()
+    users = _get_match_users(conn.cursor(), room) if room else None
+    if not users or user_id not in users:
+        conn.close()
+        emit('ai_error', {'requestId': request_id, 'error': 'Match not found'})
+        return
+    other_id = users[1] if users[0] == user_id else users[0]
+    me = profile_content.icebreaker_profile(conn, user_id)
+    them = profile_content.icebreaker_profile(conn, other_id)
+    conn.close()
+
+    _stream_ai('ai_icebreakers', request_id, lambda on_token, cancelled: {
+        'icebreakers': ai.generate_icebreakers(me, them, count=3, on_token=on_token, cancelled=cancelled)
+    })
+
+@socketio.on('ai_cancel')
+def on_ai_cancel(data):
+    cancel = _ai_streams.get(request.sid, {}).get(data.get('requestId'))
+    if cancel:
+        cancel.set()
+
 if __name__ == '__main__':
     # Initialize database tables
     init_db()
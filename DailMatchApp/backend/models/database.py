@@ -10,6 +10,272 @@ def get_db():
     conn.row_factory = sqlite3.Row
     return conn
 
+def has_message_search(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+    return cursor.fetchone() is not None
+
+def init_message_search(cursor):
+    """
+    FTS5 index over messages.text, kept in sync by triggers.
+    Each row also indexes its participants ("u<sender> u<receiver>") so a
+    search only walks the requesting user's messages. The index is
+    external-content (text isn't stored twice), read back through a view.
+    Skipped if this SQLite build has no FTS5.
+    """
+    created = not has_message_search(cursor)
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS messages_search_source AS
+        SELECT id, text, 'u' || sender_id || ' u' || receiver_id AS participants
+        FROM messages
+    ''')
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                text,
+                participants,
+                content='messages_search_source',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Message search disabled: {e}")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text, participants)
+            VALUES (new.id, new.text, 'u' || new.sender_id || ' u' || new.receiver_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, participants)
+            VALUES ('delete', old.id, old.text, 'u' || old.sender_id || ' u' || old.receiver_id);
+        END
+    ''')
+    # Only text edits touch the index; read-receipt updates don't
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, participants)
+            VALUES ('delete', old.id, old.text, 'u' || old.sender_id || ' u' || old.receiver_id);
+            INSERT INTO messages_fts (rowid, text, participants)
+            VALUES (new.id, new.text, 'u' || new.sender_id || ' u' || new.receiver_id);
+        END
+    ''')
+
+    # Index messages that existed before the search table
+    if created:
+        rebuild_message_search(cursor)
+
+def rebuild_message_search(cursor):
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+def init_versioning(cursor):
+    """
+    Version counters behind the ETags of the profile and match list endpoints.
+    user_profiles.version is bumped by the code that edits a profile;
+    users.matches_version is bumped by triggers whenever anything shown in
+    that user's match list changes (matches, messages, a partner's photos).
+    """
+    for table, column in (('user_profiles', 'version'), ('users', 'matches_version'),
+                          ('profiles', 'version')):
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER DEFAULT 1")
+        except Exception:
+            pass  # Already there (or, for the models layer's profiles, no such table)
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS matches_version_match_insert AFTER INSERT ON matches BEGIN
+            UPDATE users SET matches_version = matches_version + 1 WHERE id IN (new.user1_id, new.user2_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS matches_version_match_delete AFTER DELETE ON matches BEGIN
+            UPDATE users SET matches_version = matches_version + 1 WHERE id IN (old.user1_id, old.user2_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS matches_version_message_insert AFTER INSERT ON messages BEGIN
+            UPDATE users SET matches_version = matches_version + 1 WHERE id IN (new.sender_id, new.receiver_id);
+        END
+    ''')
+    # Archiving can remove a conversation's last hot message
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS matches_version_message_delete AFTER DELETE ON messages BEGIN
+            UPDATE users SET matches_version = matches_version + 1 WHERE id IN (old.sender_id, old.receiver_id);
+        END
+    ''')
+    # A new first photo changes every partner's list
+    cursor.execute('DROP TRIGGER IF EXISTS matches_version_photos')
+    for event, row in (('INSERT', 'new'), ('DELETE', 'old'), ('UPDATE OF position, url', 'new')):
+        name = event.split()[0].lower()
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS matches_version_photo_{name} AFTER {event} ON profile_photos BEGIN
+                UPDATE users SET matches_version = matches_version + 1
+                WHERE id IN (
+                    SELECT CASE WHEN user1_id = {row}.user_id THEN user2_id ELSE user1_id END
+                    FROM matches WHERE user1_id = {row}.user_id OR user2_id = {row}.user_id
+                );
+            END
+        ''')
+
+def init_profile_content(cursor):
+    """
+    Photos, prompts and interests as rows instead of JSON arrays, so reads are
+    indexed lookups and an edit only touches the rows that changed.
+    Both profile layers (user_profiles and the models' profiles table) share
+    these tables, keyed by user_id.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_profile_photos_user
+        ON profile_photos (user_id, position)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_prompts (
+            user_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            question TEXT,
+            answer TEXT,
+            PRIMARY KEY (user_id, position)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_interests (
+            user_id INTEGER NOT NULL,
+            interest TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (user_id, interest)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_profile_interests_interest
+        ON profile_interests (interest)
+    ''')
+
+    migrate_profile_json(cursor)
+
+def migrate_profile_json(cursor):
+    """
+    Move photos/prompts/interests out of the old JSON columns into the child
+    tables, then clear the columns so this is a no-op on later startups.
+    """
+    cursor.execute('''
+        INSERT INTO profile_photos (user_id, position, url)
+        SELECT p.user_id, j.key, j.value
+        FROM user_profiles p, json_each(p.photos) j
+        WHERE json_valid(p.photos) AND j.type = 'text'
+    ''')
+    cursor.execute('''
+        INSERT INTO profile_prompts (user_id, position, question, answer)
+        SELECT p.user_id, j.key, json_extract(j.value, '$.question'), json_extract(j.value, '$.answer')
+        FROM user_profiles p, json_each(p.prompts) j
+        WHERE json_valid(p.prompts) AND j.type = 'object'
+    ''')
+    cursor.execute('''
+        UPDATE user_profiles SET photos = NULL, prompts = NULL
+        WHERE photos IS NOT NULL OR prompts IS NOT NULL
+    ''')
+
+    try:
+        # The models layer's photos go after any the user already has (duplicates skipped)
+        cursor.execute('''
+            INSERT INTO profile_photos (user_id, position, url)
+            SELECT p.user_id,
+                   COALESCE((SELECT MAX(position) + 1 FROM profile_photos pp WHERE pp.user_id = p.user_id), 0) + j.key,
+                   j.value
+            FROM profiles p, json_each(p.photos) j
+            WHERE json_valid(p.photos) AND j.type = 'text'
+              AND NOT EXISTS (SELECT 1 FROM profile_photos pp WHERE pp.user_id = p.user_id AND pp.url = j.value)
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO profile_interests (user_id, interest, position)
+            SELECT p.user_id, j.value, j.key
+            FROM profiles p, json_each(p.interests) j
+            WHERE json_valid(p.interests) AND j.type = 'text'
+        ''')
+        cursor.execute('''
+            UPDATE profiles SET photos = NULL, interests = NULL
+            WHERE photos IS NOT NULL OR interests IS NOT NULL
+        ''')
+    except sqlite3.OperationalError:
+        pass  # No profiles table in this database
+
+def init_photo_refs(cursor):
+    """
+    Reference counts for stored photos (services/photo_store.py), maintained by
+    triggers on profile_photos and on image messages ("[IMAGE]:<ref>").
+    Messages only add references: archived history still points at its images.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'photo_refs'")
+    created = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS photo_refs (
+            ref TEXT PRIMARY KEY,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            size INTEGER,
+            updated_at INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_photo_refs_unreferenced
+        ON photo_refs (updated_at) WHERE refcount <= 0
+    ''')
+
+    # External (http) photos aren't ours to count
+    local = "{ref} NOT LIKE 'http://%' AND {ref} NOT LIKE 'https://%'"
+    acquire = '''
+        INSERT INTO photo_refs (ref, refcount, updated_at)
+        SELECT {ref}, 1, strftime('%s', 'now') WHERE ''' + local + '''
+        ON CONFLICT(ref) DO UPDATE SET refcount = refcount + 1, updated_at = excluded.updated_at;
+    '''
+    release = '''
+        UPDATE photo_refs SET refcount = refcount - 1, updated_at = strftime('%s', 'now') WHERE ref = {ref};
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS photo_refs_photo_insert AFTER INSERT ON profile_photos BEGIN
+            {acquire.format(ref='new.url')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS photo_refs_photo_delete AFTER DELETE ON profile_photos BEGIN
+            {release.format(ref='old.url')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS photo_refs_photo_update AFTER UPDATE OF url ON profile_photos BEGIN
+            {release.format(ref='old.url')}
+            {acquire.format(ref='new.url')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS photo_refs_message_insert AFTER INSERT ON messages
+        WHEN new.text LIKE '[IMAGE]:%' BEGIN
+            {acquire.format(ref="substr(new.text, 9)")}
+        END
+    ''')
+
+    # Count the references that existed before the table
+    if created:
+        cursor.execute('''
+            INSERT INTO photo_refs (ref, refcount, updated_at)
+            SELECT ref, COUNT(*), strftime('%s', 'now') FROM (
+                SELECT url AS ref FROM profile_photos
+                WHERE url NOT LIKE 'http://%' AND url NOT LIKE 'https://%'
+                UNION ALL
+                SELECT substr(text, 9) FROM messages WHERE text LIKE '[IMAGE]:%'
+            ) GROUP BY ref
+        ''')
+
 def init_db():
     conn = get_db()
     cursor = conn.cursor()
@@ -87,6 +353,92 @@ def init_db():
         )
     ''')
 
+    # Conversation lookups (history, delta sync) filter by pair and order by id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_pair
+        ON messages (sender_id, receiver_id, id)
+    ''')
+
+    init_message_search(cursor)
+    init_profile_content(cursor)
+    init_photo_refs(cursor)
+    init_versioning(cursor)
+
+    # Pending notifications for offline recipients (one row per user + match)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            sender_id INTEGER,
+            preview TEXT,
+            message_count INTEGER DEFAULT 1,
+            status TEXT DEFAULT 'pending', -- 'pending', 'sending' or 'failed'
+            attempts INTEGER DEFAULT 0,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_queue_pending
+        ON notification_queue (status, user_id, match_id)
+    ''')
+
+    # Issued JWTs (by jti), so they can be revoked before they expire
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            jti TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            issued_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            revoked_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_revoked ON sessions (revoked_at)')
+
+    # Background jobs (services/job_queue.py); finished jobs are deleted
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            payload TEXT,
+            priority INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'queued', -- 'queued', 'running' or 'dead'
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 5,
+            run_at REAL NOT NULL,
+            lease_until REAL,
+            lease_token TEXT,
+            worker TEXT,
+            unique_key TEXT,
+            last_error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_due
+        ON jobs (status, type, priority DESC, run_at)
+    ''')
+    # At most one live job per unique_key
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_unique
+        ON jobs (unique_key) WHERE status IN ('queued', 'running')
+    ''')
+
+    # Cached LLM outputs (services/ai_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL,
+            expires_at REAL NOT NULL,
+            last_used REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache (last_used)')
+
     conn.commit()
     conn.close()
     print(f"Database initialized at {DB_NAME}")
@@ -4,6 +4,7 @@ Handles dating profile operations
 """
 
 import json
+import os
 from typing import Optional, Dict, List
 from datetime import datetime
 import sys
@@ -13,10 +14,42 @@ backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
 from models.database import get_db
+from models import profile_content
+from utils.cache import TTLCache
+
+# Profiles by user_id. Cached instances are shared between requests: treat them as read-only.
+profile_cache = TTLCache(
+    maxsize=int(os.environ.get('PROFILE_CACHE_SIZE', 2048)),
+    ttl=float(os.environ.get('PROFILE_CACHE_TTL', 60))
+)
+
+# User + user_profiles rows for the /api/user profile screens (filled by routes/user.py).
+# Both caches hold photos from the shared child tables, so child-row writes clear both.
+user_profile_cache = TTLCache(
+    maxsize=int(os.environ.get('PROFILE_CACHE_SIZE', 2048)),
+    ttl=float(os.environ.get('PROFILE_CACHE_TTL', 60))
+)
+
+
+def _bump_user_profile(conn, user_id: int) -> None:
+    """Child rows changed under the user_profiles view too: bump its ETag version"""
+    conn.execute("UPDATE user_profiles SET version = version + 1 WHERE user_id = ?", (user_id,))
 
 class Profile:
     """Dating profile model"""
     
+    # Fields that can be set on create / changed by update
+    EDITABLE_FIELDS = [
+        'name', 'age', 'bio', 'location', 'occupation', 'education', 'height',
+        'prompt1_question', 'prompt1_answer',
+        'prompt2_question', 'prompt2_answer',
+        'prompt3_question', 'prompt3_answer',
+        'interests', 'dealbreakers', 'photos'
+    ]
+    # Lists kept in child tables (see models/profile_content.py) vs. in a JSON column
+    CONTENT_FIELDS = ['interests', 'photos']
+    JSON_FIELDS = ['dealbreakers']
+    
     def __init__(self, **kwargs):
         """Initialize profile with keyword arguments"""
         self.id = kwargs.get('id')
@@ -39,7 +72,7 @@ class Profile:
         self.prompt3_question = kwargs.get('prompt3_question')
         self.prompt3_answer = kwargs.get('prompt3_answer')
         
-        # JSON fields
+        # Legacy JSON columns; interests/photos are read through decoded()
         self.interests = kwargs.get('interests', '[]')
         self.dealbreakers = kwargs.get('dealbreakers', '[]')
         self.photos = kwargs.get('photos', '[]')
@@ -49,6 +82,38 @@ class Profile:
         self.completion_percentage = kwargs.get('completion_percentage', 0)
         self.created_at = kwargs.get('created_at')
         self.updated_at = kwargs.get('updated_at')
+        # Bumped on every update; feeds the ETag of GET /api/profile/me
+        self.version = kwargs.get('version', 1)
+        
+        self._decoded_fields = {}
+    
+    def decoded(self, field: str) -> List:
+        """List field ('interests', 'dealbreakers', 'photos'), loaded once per instance"""
+        if field not in self._decoded_fields:
+            if field in Profile.CONTENT_FIELDS:
+                with get_db() as conn:
+                    Profile.load_content(conn, [self])
+            else:
+                raw = getattr(self, field)
+                self._decoded_fields[field] = json.loads(raw) if raw else []
+        return self._decoded_fields[field]
+    
+    @staticmethod
+    def load_content(conn, profiles: List['Profile']) -> None:
+        """Attach photos and interests to profiles with one query per table"""
+        user_ids = [p.user_id for p in profiles]
+        photos = profile_content.photos_for(conn, user_ids)
+        interests = profile_content.interests_for(conn, user_ids)
+        for profile in profiles:
+            profile._decoded_fields['photos'] = photos.get(profile.user_id, [])
+            profile._decoded_fields['interests'] = interests.get(profile.user_id, [])
+    
+    @staticmethod
+    def _as_list(value) -> List:
+        """List field as sent by a client: a list, a JSON-encoded list or empty"""
+        if isinstance(value, str):
+            return json.loads(value) if value else []
+        return list(value or [])
     
     @staticmethod
     def create(user_id: int, profile_data: Dict) -> Optional['Profile']:
@@ -75,51 +140,42 @@ class Profile:
                 print(f"❌ Missing required field: {field}")
                 return None
         
+        # Build the full row in memory so completion goes into the same INSERT
+        now = datetime.now()
+        fields = {field: profile_data.get(field) for field in Profile.EDITABLE_FIELDS}
+        fields.update({
+            'user_id': user_id,
+            'gender': profile_data['gender'],
+            'looking_for': profile_data['looking_for'],
+            'created_at': now,
+            'updated_at': now,
+        })
+        content = {field: Profile._as_list(fields.pop(field)) for field in Profile.CONTENT_FIELDS}
+        for field in Profile.JSON_FIELDS:
+            fields[field] = json.dumps(Profile._as_list(profile_data.get(field)))
+        
+        profile = Profile(**fields)
+        profile._decoded_fields.update(content)
+        profile.completion_percentage, profile.profile_completed = profile._completion()
+        
+        columns = list(fields) + ['completion_percentage', 'profile_completed']
+        values = list(fields.values()) + [profile.completion_percentage, profile.profile_completed]
+        
         with get_db() as conn:
-            # Convert lists to JSON strings
-            interests_json = json.dumps(profile_data.get('interests', []))
-            dealbreakers_json = json.dumps(profile_data.get('dealbreakers', []))
-            photos_json = json.dumps(profile_data.get('photos', []))
-            
-            cursor = conn.execute("""
-                INSERT INTO profiles (
-                    user_id, name, age, gender, looking_for, bio, location,
-                    occupation, education, height,
-                    prompt1_question, prompt1_answer,
-                    prompt2_question, prompt2_answer,
-                    prompt3_question, prompt3_answer,
-                    interests, dealbreakers, photos
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                user_id,
-                profile_data['name'],
-                profile_data['age'],
-                profile_data['gender'],
-                profile_data['looking_for'],
-                profile_data.get('bio'),
-                profile_data.get('location'),
-                profile_data.get('occupation'),
-                profile_data.get('education'),
-                profile_data.get('height'),
-                profile_data.get('prompt1_question'),
-                profile_data.get('prompt1_answer'),
-                profile_data.get('prompt2_question'),
-                profile_data.get('prompt2_answer'),
-                profile_data.get('prompt3_question'),
-                profile_data.get('prompt3_answer'),
-                interests_json,
-                dealbreakers_json,
-                photos_json
-            ))
-            
-            profile_id = cursor.lastrowid
-            
-            # Update completion percentage
-            Profile._update_completion(profile_id)
-            
-            print(f"✅ Profile created with ID: {profile_id}")
-            
-            return Profile.get_by_id(profile_id)
+            cursor = conn.execute(f"""
+                INSERT INTO profiles ({', '.join(columns)})
+                VALUES ({', '.join('?' for _ in columns)})
+            """, values)
+            profile.id = cursor.lastrowid
+            profile_content.set_photos(conn, user_id, content['photos'])
+            profile_content.set_interests(conn, user_id, content['interests'])
+            _bump_user_profile(conn, user_id)
+        
+        print(f"✅ Profile created with ID: {profile.id}")
+        
+        profile_cache.set(user_id, profile)
+        user_profile_cache.pop(user_id)
+        return profile
     
     @staticmethod
     def get_by_id(profile_id: int) -> Optional['Profile']:
@@ -130,94 +186,131 @@ class Profile:
                 (profile_id,)
             ).fetchone()
             
-            if row:
-                return Profile(**dict(row))
-            return None
+            if not row:
+                return None
+            profile = Profile(**dict(row))
+            Profile.load_content(conn, [profile])
+            return profile
     
     @staticmethod
     def get_by_user_id(user_id: int) -> Optional['Profile']:
-        """Get profile by user ID"""
+        """Get profile by user ID (served from profile_cache when possible)"""
+        profile = profile_cache.get(user_id)
+        if profile is not None:
+            return profile
+        
         with get_db() as conn:
             row = conn.execute(
                 "SELECT * FROM profiles WHERE user_id = ?",
                 (user_id,)
             ).fetchone()
             
-            if row:
-                return Profile(**dict(row))
-            return None
+            if not row:
+                return None
+            
+            profile = Profile(**dict(row))
+            Profile.load_content(conn, [profile])
+        
+        profile_cache.set(user_id, profile)
+        return profile
     
-    def update(self, update_data: Dict) -> bool:
+    def update(self, update_data: Dict) -> Optional['Profile']:
         """
         Update profile
         
+        Completion is computed from the merged old + new fields and written
+        in the same UPDATE; photos/interests only touch the rows that changed.
+        
         Args:
             update_data: Dictionary with fields to update
         
         Returns:
-            True if successful
+            The updated Profile, or None if there was nothing to update
         """
-        # Fields that can be updated
-        allowed_fields = [
-            'name', 'age', 'bio', 'location', 'occupation', 'education', 'height',
-            'prompt1_question', 'prompt1_answer',
-            'prompt2_question', 'prompt2_answer',
-            'prompt3_question', 'prompt3_answer',
-            'interests', 'dealbreakers', 'photos'
-        ]
-        
-        # Build UPDATE query dynamically
-        updates = []
-        values = []
-        
+        changes = {}
+        content = {}
         for field, value in update_data.items():
-            if field in allowed_fields:
+            if field not in Profile.EDITABLE_FIELDS:
+                continue
+            if field in Profile.CONTENT_FIELDS:
+                content[field] = Profile._as_list(value)
+            elif field in Profile.JSON_FIELDS and isinstance(value, list):
                 # Convert lists to JSON for JSON fields
-                if field in ['interests', 'dealbreakers', 'photos'] and isinstance(value, list):
-                    value = json.dumps(value)
-                
-                updates.append(f"{field} = ?")
-                values.append(value)
+                changes[field] = json.dumps(value)
+            else:
+                changes[field] = value
         
-        if not updates:
-            return False
+        if not changes and not content:
+            return None
         
-        # Add updated_at
-        updates.append("updated_at = ?")
-        values.append(datetime.now())
-        values.append(self.id)
+        def write_content(conn):
+            if 'photos' in content:
+                profile_content.set_photos(conn, self.user_id, content['photos'])
+            if 'interests' in content:
+                profile_content.set_interests(conn, self.user_id, content['interests'])
+        
+        return self._save(changes, content, write_content)
+    
+    def add_photo(self, url: str) -> 'Profile':
+        """Append one photo (a single INSERT); returns the updated Profile"""
+        photos = self.decoded('photos') + [url]
+        return self._save({}, {'photos': photos},
+                          lambda conn: profile_content.add_photo(conn, self.user_id, url))
+    
+    def remove_photo(self, url: str) -> 'Profile':
+        """Delete one photo (a single DELETE); returns the updated Profile"""
+        photos = list(self.decoded('photos'))
+        photos.remove(url)
+        return self._save({}, {'photos': photos},
+                          lambda conn: profile_content.remove_photo(conn, self.user_id, url))
+    
+    def _save(self, changes: Dict, content: Dict, write_content) -> 'Profile':
+        """Write column changes + completion in one UPDATE, alongside the child-row writes"""
+        # Make sure unchanged lists are loaded so they carry over to the merged profile
+        for field in Profile.CONTENT_FIELDS:
+            self.decoded(field)
+        
+        changes['updated_at'] = datetime.now()
+        
+        current = {k: v for k, v in vars(self).items() if not k.startswith('_')}
+        merged = Profile(**{**current, **changes})
+        merged._decoded_fields = {**self._decoded_fields, **content}
+        merged.completion_percentage, merged.profile_completed = merged._completion()
+        changes['completion_percentage'] = merged.completion_percentage
+        changes['profile_completed'] = merged.profile_completed
         
         with get_db() as conn:
-            conn.execute(f"""
+            if content:
+                write_content(conn)
+                _bump_user_profile(conn, self.user_id)
+            row = conn.execute(f"""
                 UPDATE profiles 
-                SET {', '.join(updates)}
+                SET {', '.join(f'{field} = ?' for field in changes)}, version = version + 1
                 WHERE id = ?
-            """, values)
+                RETURNING version
+            """, list(changes.values()) + [self.id]).fetchone()
+        merged.version = row['version'] if row else (self.version or 0) + 1
         
-        # Update completion percentage
-        Profile._update_completion(self.id)
+        # Write-through: readers get the merged profile without a re-read
+        profile_cache.set(self.user_id, merged)
+        if content:
+            user_profile_cache.pop(self.user_id)
         
         print(f"✅ Profile {self.id} updated")
-        return True
+        return merged
     
-    @staticmethod
-    def _update_completion(profile_id: int):
-        """Calculate and update profile completion percentage"""
-        profile = Profile.get_by_id(profile_id)
-        if not profile:
-            return
-        
-        # Fields to check for completion
+    def _completion(self) -> tuple[int, bool]:
+        """Calculate (completion percentage, completed?) from the current fields"""
         checks = {
-            'basic_info': all([profile.name, profile.age, profile.gender, profile.looking_for]),
-            'location': bool(profile.location),
-            'bio': bool(profile.bio and len(profile.bio) > 20),
-            'occupation': bool(profile.occupation),
-            'prompt1': bool(profile.prompt1_question and profile.prompt1_answer),
-            'prompt2': bool(profile.prompt2_question and profile.prompt2_answer),
-            'prompt3': bool(profile.prompt3_question and profile.prompt3_answer),
-            'interests': len(json.loads(profile.interests)) >= 3,
-            'photos': len(json.loads(profile.photos)) >= 2
+            'basic_info': all([self.name, self.age, self.gender, self.looking_for]),
+            'location': bool(self.location),
+            'bio': bool(self.bio and len(self.bio) > 20),
+            'occupation': bool(self.occupation),
+            'prompt1': bool(self.prompt1_question and self.prompt1_answer),
+            'prompt2': bool(self.prompt2_question and self.prompt2_answer),
+            'prompt3': bool(self.prompt3_question and self.prompt3_answer),
+            'interests': len(self.decoded('interests')) >= 3,
+            'photos': len(self.decoded('photos')) >= 2
         }
         
         # Calculate percentage
@@ -225,14 +318,7 @@ class Profile:
         total = len(checks)
         percentage = int((completed / total) * 100)
         
-        is_completed = percentage >= 80  # 80% threshold
-        
-        with get_db() as conn:
-            conn.execute("""
-                UPDATE profiles 
-                SET completion_percentage = ?, profile_completed = ?
-                WHERE id = ?
-            """, (percentage, is_completed, profile_id))
+        return percentage, percentage >= 80  # 80% threshold
     
     def to_dict(self, include_private: bool = False) -> Dict:
         """
@@ -269,8 +355,8 @@ class Profile:
                     'answer': self.prompt3_answer
                 } if self.prompt3_question else None
             ],
-            'interests': json.loads(self.interests) if self.interests else [],
-            'photos': json.loads(self.photos) if self.photos else [],
+            'interests': list(self.decoded('interests')),
+            'photos': list(self.decoded('photos')),
             'completion_percentage': self.completion_percentage,
             'profile_completed': bool(self.profile_completed)
         }
@@ -279,7 +365,7 @@ class Profile:
         data['prompts'] = [p for p in data['prompts'] if p]
         
         if include_private:
-            data['dealbreakers'] = json.loads(self.dealbreakers) if self.dealbreakers else []
+            data['dealbreakers'] = list(self.decoded('dealbreakers'))
             data['looking_for'] = self.looking_for
         
         # Always include user_id for frontend actions
@@ -0,0 +1,166 @@
+"""
+PROFILE CONTENT
+Photos, prompts and interests stored as child rows of a user's profile
+
+Readers batch by user id (one indexed query for a whole page of profiles);
+writers diff against what is stored and only touch rows that changed.
+Photos are stored as canonical references; utils.photo_urls builds the URLs.
+All functions take an open connection and leave committing to the caller.
+"""
+
+from typing import Dict, Iterable, List
+
+from utils.photo_urls import canonical_ref
+
+
+def _placeholders(ids: List[int]) -> str:
+    return ', '.join('?' for _ in ids)
+
+
+def photos_for(conn, user_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """{user_id: [url, ...]} in display order; users without photos are absent"""
+    ids = list(user_ids)
+    result: Dict[int, List[str]] = {}
+    if not ids:
+        return result
+    rows = conn.execute(f"""
+        SELECT user_id, url FROM profile_photos
+        WHERE user_id IN ({_placeholders(ids)})
+        ORDER BY user_id, position, id
+    """, ids).fetchall()
+    for row in rows:
+        result.setdefault(row['user_id'], []).append(row['url'])
+    return result
+
+
+def prompts_for(conn, user_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """{user_id: [{'question', 'answer'}, ...]}"""
+    ids = list(user_ids)
+    result: Dict[int, List[Dict]] = {}
+    if not ids:
+        return result
+    rows = conn.execute(f"""
+        SELECT user_id, question, answer FROM profile_prompts
+        WHERE user_id IN ({_placeholders(ids)})
+        ORDER BY user_id, position
+    """, ids).fetchall()
+    for row in rows:
+        result.setdefault(row['user_id'], []).append({'question': row['question'], 'answer': row['answer']})
+    return result
+
+
+def interests_for(conn, user_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """{user_id: [interest, ...]}"""
+    ids = list(user_ids)
+    result: Dict[int, List[str]] = {}
+    if not ids:
+        return result
+    rows = conn.execute(f"""
+        SELECT user_id, interest FROM profile_interests
+        WHERE user_id IN ({_placeholders(ids)})
+        ORDER BY user_id, position
+    """, ids).fetchall()
+    for row in rows:
+        result.setdefault(row['user_id'], []).append(row['interest'])
+    return result
+
+
+def icebreaker_profile(conn, user_id: int) -> Dict:
+    """The parts of a profile the icebreaker prompt uses"""
+    row = conn.execute("SELECT first_name, username FROM users WHERE id = ?", (user_id,)).fetchone()
+    return {
+        'name': (row['first_name'] or row['username']) if row else None,
+        'interests': interests_for(conn, [user_id]).get(user_id, []),
+        'prompts': prompts_for(conn, [user_id]).get(user_id, []),
+    }
+
+
+def add_photo(conn, user_id: int, url: str) -> int:
+    """Append one photo after the user's last; returns its row id"""
+    url = canonical_ref(url)
+    cursor = conn.execute("""
+        INSERT INTO profile_photos (user_id, position, url)
+        SELECT ?, COALESCE(MAX(position) + 1, 0), ? FROM profile_photos WHERE user_id = ?
+    """, (user_id, url, user_id))
+    return cursor.lastrowid
+
+
+def remove_photo(conn, user_id: int, url: str) -> bool:
+    """Delete one photo (the first with this url); False if the user doesn't have it"""
+    url = canonical_ref(url)
+    cursor = conn.execute("""
+        DELETE FROM profile_photos WHERE id = (
+            SELECT id FROM profile_photos WHERE user_id = ? AND url = ?
+            ORDER BY position, id LIMIT 1
+        )
+    """, (user_id, url))
+    return cursor.rowcount > 0
+
+
+def set_photos(conn, user_id: int, urls: List[str]) -> None:
+    """Make the user's photos exactly urls (in order), keeping rows that survive"""
+    existing = conn.execute("""
+        SELECT id, position, url FROM profile_photos WHERE user_id = ? ORDER BY position, id
+    """, (user_id,)).fetchall()
+
+    # Clients may send back the public URLs we gave them; store the reference
+    urls = [canonical_ref(url) for url in urls]
+
+    unmatched: Dict[str, List] = {}
+    for row in existing:
+        unmatched.setdefault(row['url'], []).append(row)
+
+    for position, url in enumerate(urls):
+        rows = unmatched.get(url)
+        if rows:
+            row = rows.pop(0)
+            if row['position'] != position:
+                conn.execute("UPDATE profile_photos SET position = ? WHERE id = ?", (position, row['id']))
+        else:
+            conn.execute("INSERT INTO profile_photos (user_id, position, url) VALUES (?, ?, ?)",
+                         (user_id, position, url))
+
+    stale = [row['id'] for rows in unmatched.values() for row in rows]
+    if stale:
+        conn.execute(f"DELETE FROM profile_photos WHERE id IN ({_placeholders(stale)})", stale)
+
+
+def set_prompts(conn, user_id: int, prompts: List[Dict]) -> None:
+    """Make the user's prompts exactly prompts, rewriting only positions that changed"""
+    existing = {
+        row['position']: (row['question'], row['answer'])
+        for row in conn.execute("SELECT position, question, answer FROM profile_prompts WHERE user_id = ?",
+                                (user_id,))
+    }
+    for position, prompt in enumerate(prompts):
+        value = (prompt.get('question'), prompt.get('answer'))
+        if existing.get(position) != value:
+            conn.execute("""
+                INSERT OR REPLACE INTO profile_prompts (user_id, position, question, answer)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, position, *value))
+    if len(existing) > len(prompts):
+        conn.execute("DELETE FROM profile_prompts WHERE user_id = ? AND position >= ?", (user_id, len(prompts)))
+
+
+def set_interests(conn, user_id: int, interests: List[str]) -> None:
+    """Make the user's interests exactly interests (duplicates dropped)"""
+    existing = {
+        row['interest']: row['position']
+        for row in conn.execute("SELECT interest, position FROM profile_interests WHERE user_id = ?", (user_id,))
+    }
+    wanted = list(dict.fromkeys(interests))
+    for position, interest in enumerate(wanted):
+        if interest not in existing:
+            conn.execute("INSERT INTO profile_interests (user_id, interest, position) VALUES (?, ?, ?)",
+                         (user_id, interest, position))
+        elif existing[interest] != position:
+            conn.execute("UPDATE profile_interests SET position = ? WHERE user_id = ? AND interest = ?",
+                         (position, user_id, interest))
+
+    keep = set(wanted)
+    removed = [interest for interest in existing if interest not in keep]
+    if removed:
+        conn.execute(f"""
+            DELETE FROM profile_interests WHERE user_id = ? AND interest IN ({_placeholders(removed)})
+        """, [user_id] + removed)
@@ -1,5 +1,5 @@
-import bcrypt
 from .database import get_db
+from utils.passwords import hash_password, check_password
 
 class User:
     """Simple User model interacting with the SQLite database.
@@ -23,7 +23,7 @@ class User:
         """Create a new user record.
         Returns a User instance on success, or None if the user already exists.
         """
-        hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_pw = hash_password(password)
         conn = get_db()
         cursor = conn.cursor()
         try:
@@ -67,7 +67,7 @@ class User:
     @staticmethod
     def verify_password(password, password_hash):
         """Verify a plaintext password against a stored bcrypt hash."""
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash)
+        return check_password(password, password_hash)
 
     def to_dict(self):
         """Return a serializable representation of the user (excluding password)."""
@@ -1,14 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 from models.database import get_db
-import bcrypt
-import jwt
-import datetime
-import os
+from utils.passwords import hash_password, check_password, PasswordHasherBusy
+from utils.auth import generate_token, login_required
+from utils.sessions import registry
+from utils.rate_limit import rate_limit, login_backoff
 
 auth_bp = Blueprint('auth', __name__)
-SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key")
 
 @auth_bp.route('/signup', methods=['POST'])
+@rate_limit('signup')
 def signup():
     data = request.get_json()
     email = data.get('email')
@@ -18,7 +18,10 @@ def signup():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
         
-    hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    try:
+        hashed_pw = hash_password(password)
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Server busy, please try again'}), 503
     
     conn = get_db()
     cursor = conn.cursor()
@@ -30,10 +33,7 @@ def signup():
         conn.commit()
         user_id = cursor.lastrowid
         
-        token = jwt.encode({
-            'user_id': user_id,
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, SECRET_KEY, algorithm="HS256")
+        token = generate_token(user_id)
         
         return jsonify({
             'token': token,
@@ -49,22 +49,36 @@ def signup():
         conn.close()
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login')
 def login():
     data = request.get_json()
     email = data.get('email')
     password = data.get('password')
     
+    if not email or not password:
+        return jsonify({'error': 'Email and password required'}), 400
+    
+    # Exponential backoff per account after repeated failures
+    wait = login_backoff.retry_after(email)
+    if wait:
+        response = jsonify({'error': 'Too many failed attempts, try again later'})
+        response.headers['Retry-After'] = str(int(wait) + 1)
+        return response, 429
+    
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = cursor.fetchone()
     conn.close()
     
-    if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
-        token = jwt.encode({
-            'user_id': user['id'],
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, SECRET_KEY, algorithm="HS256")
+    try:
+        valid = bool(user) and check_password(password, user['password'])
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Server busy, please try again'}), 503
+    
+    if valid:
+        login_backoff.success(email)
+        token = generate_token(user['id'])
         
         return jsonify({
             'token': token,
@@ -75,4 +89,20 @@ def login():
             }
         })
     
+    login_backoff.failure(email)
     return jsonify({'error': 'Invalid credentials'}), 401
+
+@auth_bp.route('/logout', methods=['POST'])
+@login_required
+def logout():
+    jti = g.token.get('jti')
+    if jti:
+        registry.revoke(jti)
+    return jsonify({'success': True})
+
+@auth_bp.route('/logout-all', methods=['POST'])
+@login_required
+def logout_all():
+    # Also the hook for password resets: every outstanding token stops working
+    revoked = registry.revoke_user(g.user_id)
+    return jsonify({'success': True, 'revoked': revoked})
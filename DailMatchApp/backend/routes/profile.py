@@ -1,8 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 import sys
 from pathlib import Path
-import json
-import os
 
 # Fix import path so we can import models and utils
 backend_dir = Path(__file__).parent.parent
@@ -10,8 +8,9 @@ sys.path.insert(0, str(backend_dir))
 
 from models.profile import Profile
 from utils.auth import login_required
-from utils.helpers import save_file
+from utils.photo_urls import photo_url, canonical_ref
 from services.ai_service import DailyMatchAI
+from services import photo_store
 
 bp = Blueprint('profile', __name__, url_prefix='/api/profile')
 ai = DailyMatchAI()
@@ -108,12 +107,11 @@ def update_profile():
     if not profile:
         return jsonify({'error': 'Profile not found'}), 404
 
-    success = profile.update(data)
-    if not success:
+    # update() hands back the merged profile, so no re-read is needed
+    updated_profile = profile.update(data)
+    if not updated_profile:
         return jsonify({'error': 'No valid fields to update'}), 400
 
-    updated_profile = Profile.get_by_user_id(request.user_id)
-
     return jsonify({
         'message': 'Profile updated successfully',
         'profile': updated_profile.to_dict(include_private=True)
@@ -146,8 +144,8 @@ def upload_photo():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    # Save file to disk
-    rel_path = save_file(file, 'profiles', request.user_id)
+    # Save file to disk (content-addressed: re-uploading the same image reuses it)
+    rel_path = photo_store.save_upload(file)
     if not rel_path:
         return jsonify({'error': 'Invalid file type (use png/jpg/jpeg/gif)'}), 400
 
@@ -156,15 +154,13 @@ def upload_photo():
     if not profile:
         return jsonify({'error': 'Profile not found'}), 404
 
-    current_photos = json.loads(profile.photos) if profile.photos else []
-    current_photos.append(rel_path)
-
-    profile.update({'photos': current_photos})
+    # One new row in profile_photos; the existing photos aren't rewritten
+    updated_profile = profile.add_photo(rel_path)
 
     return jsonify({
         'message': 'Photo uploaded successfully',
-        'url': f"/api/uploads/{rel_path}",
-        'photos': current_photos
+        'url': photo_url(rel_path),
+        'photos': updated_profile.decoded('photos')
     }), 201
 
 
@@ -173,7 +169,7 @@ def upload_photo():
 def delete_photo():
 
     data = request.get_json() or {}
-    photo_path = data.get('path')
+    photo_path = canonical_ref(data.get('path') or '')
 
     if not photo_path:
         return jsonify({'error': 'No photo path provided'}), 400
@@ -182,26 +178,21 @@ def delete_photo():
     if not profile:
         return jsonify({'error': 'Profile not found'}), 404
 
-    current_photos = json.loads(profile.photos) if profile.photos else []
-
-    if photo_path not in current_photos:
+    if photo_path not in profile.decoded('photos'):
         return jsonify({'error': 'Photo not found in your profile'}), 404
 
     # Remove from DB list
-    current_photos.remove(photo_path)
-    profile.update({'photos': current_photos})
+    updated_profile = profile.remove_photo(photo_path)
 
-    # Delete physical file (best effort)
+    # Other profiles or messages may share the file; it's only deleted once unreferenced past the grace period
     try:
-        full_path = Path(current_app.config['UPLOAD_FOLDER']) / photo_path
-        if full_path.exists():
-            os.remove(str(full_path))
+        photo_store.release(photo_path)
     except Exception as e:
         print(f"Error deleting file {photo_path}: {e}")
 
     return jsonify({
         'message': 'Photo deleted',
-        'photos': current_photos
+        'photos': updated_profile.decoded('photos')
     }), 200
 
 @bp.route('/ai/improve-answer', methods=['POST'])
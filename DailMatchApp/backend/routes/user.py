@@ -1,67 +1,111 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import HTTPException
 from models.database import get_db
+from models import profile_content
+from models.profile import profile_cache, user_profile_cache
+from services import search_service, image_pipeline, job_queue, photo_store
+from utils.auth import current_user_id, login_required
+from utils.rate_limit import rate_limit
+from utils.etag import make_etag, not_modified, with_etag
+from utils.photo_urls import SIZES, photo_url, photo_urls, url_epoch, verify
 import json
 import os
-import time
-from werkzeug.utils import secure_filename
 
 user_bp = Blueprint('user', __name__)
 
 # Configure upload folder
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+UPLOAD_FOLDER = photo_store.UPLOAD_DIR
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+def _load_user_profile(user_id):
+    """
+    User + extended profile with photos/prompts already decoded, or None.
+    Cached in user_profile_cache; update_profile and Profile child-row writes invalidate it.
+    Cached dicts are shared between requests: treat them as read-only.
+    """
+    user_id = int(user_id)
+    cached = user_profile_cache.get(user_id)
+    if cached is not None:
+        return cached
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT u.id, u.email, u.username, u.first_name, u.last_name,
+               p.user_id AS has_profile, p.bio, p.occupation, p.education, p.height,
+               p.location, p.version
+        FROM users u
+        LEFT JOIN user_profiles p ON p.user_id = u.id
+        WHERE u.id = ?
+    ''', (user_id,))
+    row = cursor.fetchone()
+
+    if not row:
+        conn.close()
+        return None
+
+    data = {
+        'id': row['id'],
+        'name': f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() or row['username'],
+        'email': row['email'],
+        'profile': None,
+        'version': 0,
+    }
+    if row['has_profile'] is not None:
+        data['version'] = row['version'] or 0
+        data['profile'] = {
+            'bio': row['bio'],
+            'occupation': row['occupation'],
+            'education': row['education'],
+            'height': row['height'],
+            'location': row['location'],
+            'photos': profile_content.photos_for(conn, [user_id]).get(user_id, []),
+            'prompts': profile_content.prompts_for(conn, [user_id]).get(user_id, []),
+        }
+    conn.close()
+
+    user_profile_cache.set(user_id, data)
+    return data
 
 @user_bp.route('/profile', methods=['GET'])
+@login_required
 def get_profile():
-    user_id = request.headers.get('User-Id', 1)
-    
-    conn = get_db()
-    cursor = conn.cursor()
+    user_id = current_user_id()
     
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
+    data = _load_user_profile(user_id)
+    if not data:
         return jsonify({'error': 'User not found'}), 404
-        
-    cursor.execute('SELECT * FROM user_profiles WHERE user_id = ?', (user_id,))
-    profile = cursor.fetchone()
     
-    conn.close()
+    etag = make_etag('profile-me', data['id'], data['version'], url_epoch())
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
     response = {
-        'name': f"{user['first_name'] or ''} {user['last_name'] or ''}".strip() or user['username'],
-        'email': user['email'],
+        'name': data['name'],
+        'email': data['email'],
         'age': 25, 
     }
     
+    profile = data['profile']
     if profile:
-        photos = json.loads(profile['photos']) if profile['photos'] else []
-        base_url = request.host_url.rstrip('/')
-        photos = [p if p.startswith('http') else f"{base_url}/api/user/uploads/{p}" for p in photos]
-
         response.update({
             'bio': profile['bio'],
             'occupation': profile['occupation'],
             'education': profile['education'],
             'height': profile['height'],
             'location': profile['location'],
-            'photos': photos,
-            'prompts': json.loads(profile['prompts']) if profile['prompts'] else [],
+            'photos': photo_urls(profile['photos'], 'full'),
+            'prompts': profile['prompts'],
         })
         
-    return jsonify({'profile': response})
+    return with_etag(jsonify({'profile': response}), etag)
 
 @user_bp.route('/profile', methods=['PUT'])
+@login_required
 def update_profile():
-    user_id = request.headers.get('User-Id', 1)
+    user_id = current_user_id()
     
     # Handle multipart/form-data
     bio = request.form.get('bio', '')
@@ -71,95 +115,111 @@ def update_profile():
     location = request.form.get('location', '')
     prompts = request.form.get('prompts', '[]')
     
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        prompts = json.loads(prompts) or []
+    except ValueError:
+        prompts = None
+    if not isinstance(prompts, list):
+        return jsonify({'error': 'prompts must be a JSON list'}), 400
+    prompts = [p for p in prompts if isinstance(p, dict)]
     
-    # Get existing photos first
-    cursor.execute('SELECT photos FROM user_profiles WHERE user_id = ?', (user_id,))
-    existing_profile = cursor.fetchone()
-    current_photos = json.loads(existing_profile['photos']) if existing_profile and existing_profile['photos'] else []
+    # Files are stored before the write transaction opens, so the lock isn't held during I/O
+    refs = [photo_store.save_upload(file) for file in request.files.getlist('photo')]
     
-    # Handle new file uploads
-    if 'photo' in request.files:
-        files = request.files.getlist('photo')
-        for file in files:
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(f"{user_id}_{int(time.time())}_{file.filename}")
-                file.save(os.path.join(UPLOAD_FOLDER, filename))
-                current_photos.append(filename)
+    conn = get_db()
+    cursor = conn.cursor()
     
     # Update DB
     cursor.execute('SELECT user_id FROM user_profiles WHERE user_id = ?', (user_id,))
     exists = cursor.fetchone()
     
-    photos_json = json.dumps(current_photos)
-    
     if exists:
         cursor.execute('''
             UPDATE user_profiles 
-            SET bio=?, occupation=?, education=?, height=?, location=?, photos=?, prompts=?
+            SET bio=?, occupation=?, education=?, height=?, location=?,
+                version = version + 1
             WHERE user_id=?
-        ''', (bio, occupation, education, height, location, photos_json, prompts, user_id))
+        ''', (bio, occupation, education, height, location, user_id))
     else:
         cursor.execute('''
-            INSERT INTO user_profiles (user_id, bio, occupation, education, height, location, photos, prompts)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, bio, occupation, education, height, location, photos_json, prompts))
+            INSERT INTO user_profiles (user_id, bio, occupation, education, height, location)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, bio, occupation, education, height, location))
+    
+    # New uploads are appended as rows; prompts only rewrite the ones that changed
+    for ref in refs:
+        if ref:
+            profile_content.add_photo(conn, user_id, ref)
+    profile_content.set_prompts(conn, user_id, prompts)
+    
+    current_photos = profile_content.photos_for(conn, [user_id]).get(user_id, [])
         
     conn.commit()
     conn.close()
+    user_profile_cache.pop(int(user_id))
+    profile_cache.pop(int(user_id))  # the models' Profile reads the same photo rows
     
     return jsonify({'success': True, 'photos': current_photos})
 
 @user_bp.route('/profile/<int:target_id>', methods=['GET'])
 def get_public_profile(target_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE id = ?', (target_id,))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
+    data = _load_user_profile(target_id)
+    if not data:
         return jsonify({'error': 'User not found'}), 404
-        
-    cursor.execute('SELECT * FROM user_profiles WHERE user_id = ?', (target_id,))
-    profile = cursor.fetchone()
     
-    conn.close()
+    etag = make_etag('profile', data['id'], data['version'], url_epoch())
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
     response = {
-        'id': user['id'],
-        'name': f"{user['first_name'] or ''} {user['last_name'] or ''}".strip() or user['username'],
+        'id': data['id'],
+        'name': data['name'],
         'age': 25, 
     }
     
+    profile = data['profile']
     if profile:
-        photos = json.loads(profile['photos']) if profile['photos'] else []
-        base_url = request.host_url.rstrip('/')
-        photos = [p if p.startswith('http') else f"{base_url}/api/user/uploads/{p}" for p in photos]
-
         response.update({
             'bio': profile['bio'],
             'occupation': profile['occupation'],
             'education': profile['education'],
             'location': profile['location'],
-            'photos': photos,
-            'prompts': json.loads(profile['prompts']) if profile['prompts'] else [],
+            'photos': photo_urls(profile['photos'], 'full'),
+            'prompts': profile['prompts'],
         })
         
-    return jsonify({'profile': response})
+    return with_etag(jsonify({'profile': response}), etag)
 
 # Serve uploaded files
 @user_bp.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    if not verify(filename, request.args.get('expires'), request.args.get('sig')):
+        return jsonify({'error': 'Invalid or expired photo link'}), 403
+    return photo_store.send_photo(photo_store.path_for(filename), immutable=photo_store.is_hashed(filename))
+
+@user_bp.route('/uploads/<size>/<filename>')
+def uploaded_rendition(size, filename):
+    if size not in SIZES:
+        return jsonify({'error': 'Unknown size'}), 404
+    if not verify(f"{size}/{filename}", request.args.get('expires'), request.args.get('sig')):
+        return jsonify({'error': 'Invalid or expired photo link'}), 403
+    
+    original = photo_store.path_for(filename)
+    path = image_pipeline.rendition_path(original, size)
+    if os.path.exists(path):
+        return photo_store.send_photo(path, mimetype=image_pipeline.rendition_mimetype(),
+                                      immutable=photo_store.is_hashed(filename))
+    
+    # Not processed yet (or no Pillow here): the original, cached only briefly
+    return photo_store.send_photo(original, immutable=False, max_age=60)
 
 # --- Matching Routes ---
 
 @user_bp.route('/matches/potential', methods=['GET'])
+@login_required
 def get_potential_matches():
-    user_id = request.headers.get('User-Id', 1)
+    user_id = current_user_id()
     
     # Get filters
     min_age = request.args.get('min_age', 18, type=int)
@@ -171,7 +231,7 @@ def get_potential_matches():
     
     # Base query
     query = '''
-        SELECT u.id, u.first_name, u.last_name, u.dob, u.gender, p.bio, p.occupation, p.education, p.height, p.location, p.photos, p.prompts
+        SELECT u.id, u.first_name, u.last_name, u.dob, u.gender, p.bio, p.occupation, p.education, p.height, p.location
         FROM users u
         LEFT JOIN user_profiles p ON u.id = p.user_id
         WHERE u.id != ? 
@@ -197,13 +257,16 @@ def get_potential_matches():
     rows = cursor.fetchall()
     matches = []
     
+    # Photos and prompts for the whole page in two indexed queries
+    ids = [row['id'] for row in rows]
+    all_photos = profile_content.photos_for(conn, ids)
+    all_prompts = profile_content.prompts_for(conn, ids)
+    
     import datetime
     current_year = datetime.datetime.now().year
     
     for row in rows:
-        photos = json.loads(row['photos']) if row['photos'] else []
-        base_url = request.host_url.rstrip('/')
-        photos = [p if p.startswith('http') else f"{base_url}/api/user/uploads/{p}" for p in photos]
+        photos = photo_urls(all_photos.get(row['id'], []), 'feed')
         
         # Calculate age
         dob_year = int(row['dob'].split('-')[0]) if row['dob'] else 2000
@@ -219,15 +282,17 @@ def get_potential_matches():
             'height': row['height'] or '',
             'location': row['location'] or '',
             'photos': photos if photos else ['https://randomuser.me/api/portraits/women/1.jpg'],
-            'prompts': json.loads(row['prompts']) if row['prompts'] else [],
+            'prompts': all_prompts.get(row['id'], []),
         })
         
     conn.close()
     return jsonify({'matches': matches})
 
 @user_bp.route('/matches/swipe', methods=['POST'])
+@login_required
+@rate_limit('swipe', by='user')
 def swipe():
-    user_id = request.headers.get('User-Id', 1)
+    user_id = current_user_id()
     data = request.get_json()
     target_id = data.get('targetUserId')
     action = data.get('action')
@@ -262,6 +327,12 @@ def swipe():
                                   (min(int(user_id), int(target_id)), max(int(user_id), int(target_id))))
                     is_match = True
                     match_id = cursor.lastrowid
+
+                    # Have openers cached by the time either of them opens the chat
+                    for me, them in ((int(user_id), int(target_id)), (int(target_id), int(user_id))):
+                        job_queue.enqueue('ai.icebreakers', {'user_id': me, 'other_id': them},
+                                          priority=job_queue.PRIORITY_LOW,
+                                          unique_key=f"icebreakers:{match_id}:{me}", conn=conn)
                     
                     # If there's a comment, insert it as a message to start conversation
                     if comment:
@@ -277,42 +348,41 @@ def swipe():
     return jsonify({'success': True, 'match': is_match, 'match_id': match_id if is_match else None})
 
 @user_bp.route('/matches', methods=['GET'])
+@login_required
 def get_matches():
     try:
-        user_id_header = request.headers.get('User-Id', '1')
-        # Handle 'undefined' or empty string
-        if not user_id_header or user_id_header == 'undefined':
-             user_id = 1
-        else:
-             user_id = int(user_id_header)
+        user_id = current_user_id()
         
         conn = get_db()
         cursor = conn.cursor()
         
+        # Bumped by triggers on any change to this list (see init_versioning)
+        cursor.execute('SELECT matches_version FROM users WHERE id = ?', (user_id,))
+        version = cursor.fetchone()
+        etag = make_etag('matches', user_id, version['matches_version'] if version else 0, url_epoch())
+        cached = not_modified(etag)
+        if cached:
+            conn.close()
+            return cached
+        
         cursor.execute('''
-            SELECT m.*, u.first_name, u.username, p.photos
+            SELECT m.*, u.first_name, u.username
             FROM matches m
             LEFT JOIN users u ON u.id = (CASE WHEN m.user1_id = ? THEN m.user2_id ELSE m.user1_id END)
-            LEFT JOIN user_profiles p ON p.user_id = (CASE WHEN m.user1_id = ? THEN m.user2_id ELSE m.user1_id END)
             WHERE m.user1_id = ? OR m.user2_id = ?
-        ''', (user_id, user_id, user_id, user_id))
+        ''', (user_id, user_id, user_id))
         
         rows = cursor.fetchall()
         matches = []
         
+        partner_ids = [row['user1_id'] if int(row['user2_id']) == int(user_id) else row['user2_id'] for row in rows]
+        all_photos = profile_content.photos_for(conn, partner_ids)
+        
         for row in rows:
-            try:
-                photos_json = row['photos']
-                photos = json.loads(photos_json) if photos_json else []
-            except:
-                photos = []
-                
-            photo = photos[0] if photos else 'https://randomuser.me/api/portraits/women/1.jpg'
-            if photo and not photo.startswith('http'):
-                base_url = request.host_url.rstrip('/')
-                photo = f"{base_url}/api/user/uploads/{photo}"
-                
             other_user_id = row['user1_id'] if int(row['user2_id']) == int(user_id) else row['user2_id']
+            photos = all_photos.get(other_user_id, [])
+                
+            photo = photo_url(photos[0], 'thumb') if photos else 'https://randomuser.me/api/portraits/women/1.jpg'
             
             # Get actual last message
             cursor.execute('''
@@ -338,18 +408,28 @@ def get_matches():
             })
         
         conn.close()
-        return jsonify({'matches': matches})
+        return with_etag(jsonify({'matches': matches}), etag)
     except Exception as e:
         print(f"Error in get_matches: {e}")
         return jsonify({'matches': [], 'error': str(e)}), 500
 
+@user_bp.route('/messages/search', methods=['GET'])
+@login_required
+def search_messages():
+    user_id = current_user_id()
+    q = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+
+    if not q.strip():
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    return jsonify(search_service.search_messages(user_id, q, page, per_page))
+
 @user_bp.route('/matches/<match_id>', methods=['DELETE'])
+@login_required
 def unmatch_user(match_id):
-    user_id_header = request.headers.get('User-Id', '1')
-    try:
-        user_id = int(user_id_header) if user_id_header and user_id_header != 'undefined' else 1
-    except:
-        user_id = 1
+    user_id = current_user_id()
 
     conn = get_db()
     cursor = conn.cursor()
@@ -372,12 +452,13 @@ def upload_generic():
             return jsonify({'error': 'No photo provided'}), 400
             
         file = request.files['photo']
-        if file and allowed_file(file.filename):
-            filename = secure_filename(f"chat_{int(time.time())}_{file.filename}")
-            file.save(os.path.join(UPLOAD_FOLDER, filename))
-            
-            return jsonify({'success': True, 'filename': filename})
+        # Referenced once the "[IMAGE]:<filename>" message is sent
+        filename = photo_store.save_upload(file)
+        if filename:
+            return jsonify({'success': True, 'filename': filename, 'url': photo_url(filename, 'feed')})
             
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Upload failed'}), 400
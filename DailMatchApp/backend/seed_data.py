@@ -1,5 +1,4 @@
 import sqlite3
-import json
 import os
 from werkzeug.security import generate_password_hash
 
@@ -20,6 +19,8 @@ def seed_data():
     # Delete test users if they exist to avoid duplicate errors
     # We leave users > 100 alone (real users usually)
     cursor.execute("DELETE FROM user_profiles WHERE user_id <= 100")
+    cursor.execute("DELETE FROM profile_photos WHERE user_id <= 100")
+    cursor.execute("DELETE FROM profile_prompts WHERE user_id <= 100")
     cursor.execute("DELETE FROM users WHERE id <= 100")
     cursor.execute("DELETE FROM likes WHERE user_id <= 100 OR target_id <= 100")
     cursor.execute("DELETE FROM matches WHERE user1_id <= 100 OR user2_id <= 100")
@@ -261,10 +262,15 @@ def seed_data():
             # Insert Profile
             p = u['profile']
             cursor.execute('''
-                INSERT INTO user_profiles (user_id, bio, occupation, education, height, location, photos, prompts)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (u['id'], p['bio'], p['occupation'], p['education'], p['height'], p['location'], 
-                  json.dumps(p['photos']), json.dumps(p['prompts'])))
+                INSERT INTO user_profiles (user_id, bio, occupation, education, height, location)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (u['id'], p['bio'], p['occupation'], p['education'], p['height'], p['location']))
+            cursor.executemany('''
+                INSERT INTO profile_photos (user_id, position, url) VALUES (?, ?, ?)
+            ''', [(u['id'], i, url) for i, url in enumerate(p['photos'])])
+            cursor.executemany('''
+                INSERT INTO profile_prompts (user_id, position, question, answer) VALUES (?, ?, ?, ?)
+            ''', [(u['id'], i, q['question'], q['answer']) for i, q in enumerate(p['prompts'])])
                   
         except sqlite3.IntegrityError as e:
             print(f"Skipping {u['username']}: {e}")
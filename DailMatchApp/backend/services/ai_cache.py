@@ -0,0 +1,116 @@
+"""
+AI CACHE
+Persistent cache of LLM outputs (icebreakers, improved answers)
+
+Keys hash the model, the prompt template's version and the normalized inputs,
+so editing a template (bump its version) or switching models never serves
+stale text. Entries live in the ai_cache table and survive restarts: they
+expire after AI_CACHE_TTL, and beyond AI_CACHE_MAX_ENTRIES the least recently
+used go first. A small in-memory LRU in front answers repeat hits without
+touching SQLite.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db
+from utils.cache import TTLCache
+
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 7 * 24 * 3600))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 10000))
+# Eviction runs once per this many writes rather than on every one
+PRUNE_EVERY = 100
+TOUCH_INTERVAL = 3600
+
+_memory = TTLCache(maxsize=int(os.environ.get('AI_CACHE_MEMORY_SIZE', 1024)), ttl=300)
+_writes = 0
+stored = 0
+evicted = 0
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(value: Any) -> Any:
+    """Inputs as they matter to the prompt: whitespace collapsed, None and '' alike"""
+    if isinstance(value, str):
+        return _WHITESPACE.sub(' ', value).strip()
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items() if v not in (None, '', [], {})}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value if v not in (None, '', [], {})]
+    return value
+
+
+def make_key(kind: str, model: str, template_version: int, **inputs) -> str:
+    material = json.dumps([kind, model, template_version, normalize(inputs)],
+                          sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def get(key: str) -> Optional[Any]:
+    value = _memory.get(key)
+    if value is not None:
+        return value
+
+    now = time.time()
+    with get_db() as conn:
+        row = conn.execute("SELECT value, last_used FROM ai_cache WHERE key = ? AND expires_at > ?",
+                           (key, now)).fetchone()
+        if row is None:
+            return None
+        # Recency only needs to be coarse for LRU eviction; skip the write most of the time
+        if now - (row['last_used'] or 0) > TOUCH_INTERVAL:
+            conn.execute("UPDATE ai_cache SET last_used = ? WHERE key = ?", (now, key))
+    value = json.loads(row['value'])
+    _memory.set(key, value)
+    return value
+
+
+def put(key: str, value: Any, ttl: int = AI_CACHE_TTL) -> None:
+    global _writes, stored
+    now = time.time()
+    with get_db() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO ai_cache (key, value, created_at, expires_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, json.dumps(value, ensure_ascii=False), now, now + ttl, now))
+    _memory.set(key, value)
+    stored += 1
+    _writes += 1
+    if _writes % PRUNE_EVERY == 0:
+        prune()
+
+
+def prune(max_entries: int = AI_CACHE_MAX_ENTRIES) -> int:
+    """Drop expired entries, then the least recently used beyond max_entries"""
+    global evicted
+    with get_db() as conn:
+        removed = conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        removed += conn.execute("""
+            DELETE FROM ai_cache WHERE key IN (
+                SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+    evicted += removed
+    return removed
+
+
+def clear() -> None:
+    with get_db() as conn:
+        conn.execute("DELETE FROM ai_cache")
+    _memory.clear()
+
+
+def stats() -> Dict:
+    with get_db() as conn:
+        entries = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+    return {'entries': entries, 'stored': stored, 'evicted': evicted, 'memory': _memory.stats()}
@@ -0,0 +1,321 @@
+"""
+AI SCHEDULER
+Admission control in front of one Ollama server
+
+A local model serves one or two generations well and thrashes beyond that, so
+at most AI_CONCURRENCY calls run at once and the rest wait their turn:
+interactive requests (a user watching a spinner) before background precompute,
+first come first served within a priority. Identical prompts already queued or
+running are not sent twice. Later callers join the first one, get the tokens
+streamed so far, and then share its result. A more urgent caller joining a
+queued call moves it up to its own priority, and the call stays queued for as
+long as any of its callers is still willing to wait. A caller whose deadline
+passes while still queued gets None (the caller's fallback) without the model
+ever seeing the prompt. A streamed call stops once every caller waiting on it
+has gone or run out of time.
+
+The cap is per process: a separate worker.py has its own.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+AI_CONCURRENCY = int(os.environ.get('AI_CONCURRENCY', 1))
+# Seconds a call may wait for a slot (and, when streamed, run) before its caller gives up
+AI_DEADLINE = float(os.environ.get('AI_DEADLINE', 45))
+
+# Higher runs first (the same convention as services/job_queue.py)
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BACKGROUND = 0
+
+WAIT_SAMPLES = 500
+
+
+class _Call:
+    """One prompt in flight, shared by every caller that asked for it"""
+
+    def __init__(self, key: str, priority: int):
+        self.key = key
+        self.priority = priority
+        self.deadline = 0.0  # the latest of its callers' deadlines
+        self.ticket: Optional[list] = None  # heap entry while waiting for a slot
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.parts: List[str] = []
+        self.listeners: List[Callable[[str], None]] = []
+        self.cancels: List[Optional[Callable[[], bool]]] = []
+        self.deadlines: List[float] = []
+
+    def on_token(self, token: str) -> None:
+        with self.lock:
+            self.parts.append(token)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            # One caller's broken listener must not fail the generation for everyone
+            try:
+                listener(token)
+            except Exception as e:
+                print(f"❌ AI token listener failed, dropping it: {e}")
+                self.leave(listener)
+
+    def join(self, on_token: Optional[Callable[[str], None]], cancelled: Optional[Callable[[], bool]],
+             deadline: float) -> List[str]:
+        """Add a caller; returns the tokens it missed"""
+        with self.lock:
+            self.cancels.append(cancelled)
+            self.deadlines.append(deadline)
+            self.deadline = max(self.deadline, deadline)
+            if on_token:
+                self.listeners.append(on_token)
+            return list(self.parts)
+
+    def leave(self, on_token: Optional[Callable[[str], None]]) -> None:
+        with self.lock:
+            if on_token in self.listeners:
+                self.listeners.remove(on_token)
+
+    def abandoned(self) -> bool:
+        """Every caller cancelled or past its deadline"""
+        now = time.monotonic()
+        return all((cancel is not None and cancel()) or deadline <= now
+                   for cancel, deadline in zip(self.cancels, self.deadlines))
+
+
+class AIScheduler:
+    def __init__(self, concurrency: int = AI_CONCURRENCY):
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting: list = []  # heap of [-priority, seq, Event]
+        self._seq = itertools.count()
+        self._in_flight: Dict[str, _Call] = {}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.admitted = 0
+        self.deduplicated = 0
+        self.expired = 0
+        self.max_depth = 0
+
+    def _acquire(self, shared: _Call) -> bool:
+        """Wait for a slot until the call's latest deadline; False if it passed first"""
+        with self._lock:
+            if self._active < self.concurrency and not self._waiting:
+                self._active += 1
+                return True
+            ticket = threading.Event()
+            shared.ticket = [-shared.priority, next(self._seq), ticket]
+            heapq.heappush(self._waiting, shared.ticket)
+            self.max_depth = max(self.max_depth, len(self._waiting))
+
+        # Callers joining meanwhile may push the deadline out, so wait in steps
+        while not ticket.wait(max(0.0, shared.deadline - time.monotonic())):
+            with self._lock:
+                if ticket.is_set():
+                    break  # handed a slot just as the wait timed out
+                if shared.deadline <= time.monotonic():
+                    self._waiting.remove(shared.ticket)
+                    heapq.heapify(self._waiting)
+                    shared.ticket = None
+                    # Nobody can join an expired call from here on
+                    self._forget(shared)
+                    return False
+        shared.ticket = None
+        return True
+
+    def _forget(self, shared: _Call) -> None:
+        """Stop offering a call to new callers (caller holds _lock)"""
+        if self._in_flight.get(shared.key) is shared:
+            del self._in_flight[shared.key]
+
+    def _promote(self, shared: _Call, priority: int) -> None:
+        """Move a queued call up to a more urgent caller's priority (caller holds _lock)"""
+        if priority <= shared.priority:
+            return
+        shared.priority = priority
+        if shared.ticket is not None and not shared.ticket[2].is_set():
+            shared.ticket[0] = -priority
+            heapq.heapify(self._waiting)
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._waiting:
+                # The slot passes straight to the most urgent waiter
+                heapq.heappop(self._waiting)[2].set()
+            else:
+                self._active -= 1
+
+    def run(self, key: str, call: Callable, priority: int = PRIORITY_INTERACTIVE,
+            timeout: float = AI_DEADLINE, on_token: Optional[Callable[[str], None]] = None,
+            cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+        """
+        Run call(on_token, cancelled) -> text under the concurrency cap, or join
+        an identical call (same key) already queued or running. Returns None if
+        the deadline passes before a slot frees up.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._lock:
+            shared = self._in_flight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._in_flight[key] = _Call(key, priority)
+            else:
+                self.deduplicated += 1
+                self._promote(shared, priority)
+            missed = shared.join(on_token, cancelled, deadline)
+
+        if not leader:
+            # Catch up on what was streamed before we joined, then wait for the leader
+            if on_token:
+                for token in missed:
+                    on_token(token)
+            finished = shared.done.wait(max(0.0, deadline - time.monotonic()))
+            shared.leave(on_token)
+            return shared.result if finished else None
+
+        try:
+            if not self._acquire(shared):
+                with self._lock:
+                    self.expired += 1
+                return None
+            waited = time.monotonic() - start
+            with self._lock:
+                self.admitted += 1
+                self._waits.append(waited)
+            try:
+                # Always streamed, so callers who join later see tokens and abandoned calls stop early
+                shared.result = call(shared.on_token, shared.abandoned)
+            finally:
+                self._release()
+            return shared.result
+        finally:
+            with self._lock:
+                self._forget(shared)
+            shared.done.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'concurrency': self.concurrency,
+                'active': self._active,
+                'queue_depth': len(self._waiting),
+                'max_depth': self.max_depth,
+                'in_flight': len(self._in_flight),
+                'admitted': self.admitted,
+                'deduplicated': self.deduplicated,
+                'expired': self.expired,
+                'wait_ms_avg': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                'wait_ms_p95': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                'wait_ms_max': round(waits[-1] * 1000, 1) if waits else 0.0,
+            }
+
+
+# Checks against a slow streaming stub Ollama: python services/ai_scheduler.py
+if __name__ == '__main__':
+    import json
+    import sys
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from services.ai_service import DailyMatchAI
+
+    seen = {'active': 0, 'max_active': 0, 'prompts': []}
+    seen_lock = threading.Lock()
+
+    class StubOllama(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with seen_lock:
+                seen['active'] += 1
+                seen['max_active'] = max(seen['max_active'], seen['active'])
+                seen['prompts'].append(body['prompt'])
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for token in ['Hey', ' there', '\n']:
+                    line = json.dumps({'response': token, 'done': False}).encode() + b'\n'
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            finally:
+                # Before 'done': the client frees its slot as soon as it reads it
+                with seen_lock:
+                    seen['active'] -= 1
+            line = json.dumps({'response': '', 'done': True}).encode() + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(line), line))
+
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubOllama)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    ai = DailyMatchAI(base_url=f"http://127.0.0.1:{stub.server_port}", model="stub")
+    scheduler = ai.server.scheduler
+    results = {}
+
+    def start(name, prompt, priority=PRIORITY_INTERACTIVE, deadline=AI_DEADLINE, on_token=None):
+        def target():
+            results[name] = ai._generate(prompt, priority=priority, deadline=deadline, on_token=on_token)
+        thread = threading.Thread(target=target)
+        thread.start()
+        time.sleep(0.02)  # keep arrival order deterministic
+        return thread
+
+    def bad_listener(token):
+        raise RuntimeError("no request context")
+
+    # Cap, priority, dedup, a broken listener and an expired deadline in one queue
+    follower_tokens = []
+    threads = [
+        start('running', 'running'),
+        start('background', 'background', PRIORITY_BACKGROUND),
+        start('precompute', 'shared', PRIORITY_BACKGROUND, on_token=bad_listener),
+        start('interactive', 'interactive'),
+        start('joined', 'shared', on_token=follower_tokens.append),
+        start('expired', 'expired', PRIORITY_BACKGROUND, deadline=0.1),
+    ]
+    for thread in threads:
+        thread.join()
+    print(f"order: {seen['prompts']}")
+    assert seen['max_active'] == 1, seen
+    # 'shared' was promoted to the interactive caller's priority when it joined
+    assert seen['prompts'] == ['running', 'shared', 'interactive', 'background'], seen['prompts']
+    assert results['precompute'] == results['joined'] == 'Hey there', results
+    assert ''.join(follower_tokens) == 'Hey there\n', follower_tokens
+    assert results['expired'] is None and 'expired' not in seen['prompts']
+    assert ai.server.breaker.stats()['consecutive_failures'] == 0
+
+    # A follower with a later deadline keeps a queued call alive past its leader's
+    seen['prompts'].clear()
+    threads = [
+        start('running', 'running'),
+        start('short', 'patient', PRIORITY_BACKGROUND, deadline=0.05),
+        start('long', 'patient', PRIORITY_BACKGROUND),
+    ]
+    for thread in threads:
+        thread.join()
+    assert results['long'] == 'Hey there' and 'patient' in seen['prompts'], (results, seen['prompts'])
+
+    stats = scheduler.stats()
+    print(f"scheduler: {stats}")
+    assert stats['deduplicated'] == 2 and stats['expired'] == 1 and stats['queue_depth'] == 0
+    print("✅ AI scheduler checks passed")
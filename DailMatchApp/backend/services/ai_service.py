@@ -1,54 +1,241 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
 import requests
-from typing import Dict, List, Optional
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, List, Optional
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from services import ai_cache
+from services.ai_scheduler import AIScheduler, AI_DEADLINE, PRIORITY_INTERACTIVE
+from utils.circuit_breaker import CircuitBreaker, OPEN
+
+# Seconds between background reachability checks of each Ollama server
+AI_HEALTH_INTERVAL = float(os.environ.get('AI_HEALTH_INTERVAL', 15))
+# Consecutive failed/timed-out generations that open the breaker, and how long it stays open
+AI_BREAKER_THRESHOLD = int(os.environ.get('AI_BREAKER_THRESHOLD', 3))
+AI_BREAKER_COOLDOWN = float(os.environ.get('AI_BREAKER_COOLDOWN', 30))
+# Kept-alive connections per server (extra concurrent calls open, then drop, their own)
+AI_POOL_SIZE = int(os.environ.get('AI_POOL_SIZE', 4))
+# (connect, read) timeouts: a dead host fails fast, generation may take a while
+AI_CONNECT_TIMEOUT = float(os.environ.get('AI_CONNECT_TIMEOUT', 2))
+AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT', 30))
+HEALTH_TIMEOUT = (AI_CONNECT_TIMEOUT, 2)
+GENERATE_TIMEOUT = (AI_CONNECT_TIMEOUT, AI_READ_TIMEOUT)
+
+# Part of the cache key: bump when a prompt template changes so old outputs aren't reused
+IMPROVE_TEMPLATE_VERSION = 1
+ICEBREAKER_TEMPLATE_VERSION = 1
+
+
+class OllamaServer:
+    """
+    One Ollama server, shared by every client pointing at it: a pooled
+    keep-alive session, a scheduler capping concurrent generations,
+    reachability probed in the background (so requests never wait on it), a
+    circuit breaker over generations, and counters for /api/metrics.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AI_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.reachable = False
+        self.checked_at = 0.0
+        self.breaker = CircuitBreaker(AI_BREAKER_THRESHOLD, AI_BREAKER_COOLDOWN)
+        self.scheduler = AIScheduler()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def probe(self) -> bool:
+        try:
+            r = self.session.get(f"{self.base_url}/api/tags", timeout=HEALTH_TIMEOUT)
+            self.reachable = r.status_code == 200
+        except Exception:
+            self.reachable = False
+        self.checked_at = time.time()
+        return self.reachable
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(AI_HEALTH_INTERVAL)
+            self.probe()
+
+    def ensure_started(self) -> None:
+        """The first caller waits for one probe; afterwards the state is refreshed in the background"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self.probe()
+                self._thread = threading.Thread(target=self._run, name=f"ai-health-{self.base_url}", daemon=True)
+                self._thread.start()
+
+    def stats(self) -> Dict:
+        return {
+            'reachable': self.reachable,
+            'checked_at': self.checked_at,
+            'breaker': self.breaker.stats(),
+            'scheduler': self.scheduler.stats(),
+            'calls': self.calls,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'fallbacks': self.fallbacks,
+            'cancelled': self.cancelled,
+        }
+
+
+_servers: Dict[str, OllamaServer] = {}
+_servers_lock = threading.Lock()
+
+
+def server_for(base_url: str) -> OllamaServer:
+    with _servers_lock:
+        if base_url not in _servers:
+            _servers[base_url] = OllamaServer(base_url)
+        return _servers[base_url]
+
+
+def stats() -> Dict[str, Dict]:
+    """Health and breaker state per Ollama server"""
+    return {url: server.stats() for url, server in list(_servers.items())}
 
 
 class DailyMatchAI:
     def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama2:7b-chat-q4_0"):
         self.base_url = base_url.rstrip("/")
         self.model = model
+        self.server = server_for(self.base_url)
 
     def is_available(self) -> bool:
-        
-        try:
-            r = requests.get(f"{self.base_url}/api/tags", timeout=2)
-            return r.status_code == 200
-        except Exception:
-            return False
+        """Cached: reachable at the last background check, and the breaker isn't open"""
+        self.server.ensure_started()
+        available = self.server.reachable and self.server.breaker.state != OPEN
+        if not available:
+            self.server.fallbacks += 1
+        return available
 
-    def _generate(self, prompt: str, system: str = "", max_tokens: int = 300) -> Optional[str]:
-        """Low-level wrapper around Ollama's /api/generate endpoint."""
+    def _generate(self, prompt: str, system: str = "", max_tokens: int = 300,
+                  on_token: Optional[Callable[[str], None]] = None,
+                  cancelled: Optional[Callable[[], bool]] = None,
+                  priority: int = PRIORITY_INTERACTIVE, deadline: float = AI_DEADLINE) -> Optional[str]:
+        """
+        Generate through the server's scheduler: waits for a slot (by
+        priority), shares identical prompts already in flight, and returns None
+        if no slot frees up within `deadline` seconds.
+        """
+        key = hashlib.sha256(json.dumps([self.model, system, prompt, max_tokens]).encode('utf-8')).hexdigest()
+        return self.server.scheduler.run(
+            key,
+            lambda tokens, abandoned: self._call(prompt, system, max_tokens, tokens, abandoned),
+            priority=priority, timeout=deadline, on_token=on_token, cancelled=cancelled,
+        )
+
+    def _call(self, prompt: str, system: str = "", max_tokens: int = 300,
+              on_token: Optional[Callable[[str], None]] = None,
+              cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+        """
+        Low-level wrapper around Ollama's /api/generate endpoint.
+
+        With on_token the completion is streamed: each fragment is passed to
+        on_token as it arrives, and the full text is still returned. cancelled()
+        is checked between fragments. Once it is True the connection is dropped,
+        which makes Ollama stop generating, and None is returned.
+        """
+        server = self.server
+        if not server.breaker.allow():
+            server.fallbacks += 1
+            return None
+        server.calls += 1
+        stream = on_token is not None
         try:
-            r = requests.post(
+            r = server.session.post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": self.model,
                     "prompt": prompt,
                     "system": system,
-                    "stream": False,
+                    "stream": stream,
                     "options": {
                         "num_predict": max_tokens,
                         "temperature": 0.7
                     }
                 },
-                timeout=30
+                timeout=GENERATE_TIMEOUT,
+                stream=stream
             )
             if r.status_code == 200:
-                data = r.json()
-                return data.get("response", "").strip()
+                if stream:
+                    text = self._read_stream(r, on_token, cancelled)
+                else:
+                    text = r.json().get("response", "")
+                server.breaker.record_success()
+                return text.strip() if text is not None else None
+            print(f"AI error: HTTP {r.status_code}")
+        except requests.Timeout as e:
+            server.timeouts += 1
+            print(f"AI timeout: {e}")
         except Exception as e:
             print(f"AI error: {e}")
+        server.failures += 1
+        server.breaker.record_failure()
         return None
 
+    def _read_stream(self, r, on_token: Callable[[str], None],
+                     cancelled: Optional[Callable[[], bool]]) -> Optional[str]:
+        """Consume Ollama's NDJSON stream ({"response": "...", "done": false} per line)"""
+        parts = []
+        with r:
+            for line in r.iter_lines():
+                if cancelled and cancelled():
+                    self.server.cancelled += 1
+                    return None
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    on_token(token)
+                if chunk.get("done"):
+                    break
+        return "".join(parts)
+
     # ---------------------------------------------------------
     # Profile answer improvement
     # ---------------------------------------------------------
 
-    def improve_prompt_answer(self, question: str, draft_answer: str) -> str:
+    def improve_prompt_answer(self, question: str, draft_answer: str,
+                              on_token: Optional[Callable[[str], None]] = None,
+                              cancelled: Optional[Callable[[], bool]] = None,
+                              priority: int = PRIORITY_INTERACTIVE) -> str:
         """
         Improve a dating profile answer.
 
-        If AI not available, returns the original draft.
+        If AI not available, returns the original draft. on_token/cancelled
+        stream the raw completion as in _generate; the cleaned answer is returned.
         """
+        key = ai_cache.make_key('improve', self.model, IMPROVE_TEMPLATE_VERSION,
+                                question=question, draft=draft_answer)
+        cached = ai_cache.get(key)
+        if cached is not None:
+            return cached
+
         if not self.is_available():
             return draft_answer
 
@@ -68,9 +255,12 @@ Instructions:
 Improved answer:
 """
 
-        response = self._generate(prompt, system=system, max_tokens=120)
+        response = self._generate(prompt, system=system, max_tokens=120, on_token=on_token, cancelled=cancelled,
+                                  priority=priority)
         if response and len(response) > 10:
-            return response.strip().strip('"')
+            improved = response.strip().strip('"')
+            ai_cache.put(key, improved)
+            return improved
         return draft_answer
 
     # ---------------------------------------------------------
@@ -81,21 +271,30 @@ Improved answer:
         self,
         my_profile: Dict,
         their_profile: Dict,
-        count: int = 3
+        count: int = 3,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+        priority: int = PRIORITY_INTERACTIVE
     ) -> List[str]:
         """
         Generate ice-breaker messages for starting a chat with their_profile,
-        from the perspective of my_profile.
+        from the perspective of my_profile. on_token/cancelled stream the raw
+        completion as in _generate; the cleaned list is returned.
         """
 
+        # Only what the prompt uses, so unrelated profile edits keep the entry
+        key = ai_cache.make_key(
+            'icebreakers', self.model, ICEBREAKER_TEMPLATE_VERSION, count=count,
+            me={k: my_profile.get(k) for k in ('name', 'interests', 'prompts')},
+            them={k: their_profile.get(k) for k in ('name', 'interests', 'prompts')},
+        )
+        cached = ai_cache.get(key)
+        if cached is not None:
+            return cached
+
         # Fallback if no AI
         if not self.is_available():
-            name = their_profile.get("name", "there")
-            return [
-                f"Hey {name}! Your profile really stood out to me—how's your week going?",
-                f"Hi {name}, I saw you're into {', '.join(their_profile.get('interests', [])[:1]) or 'interesting things'}. What got you into that?",
-                f"Hey {name}, if we grabbed coffee tomorrow, what would you be most excited to talk about?"
-            ][:count]
+            return self._fallback_icebreakers(their_profile, count)
 
         # Prepare context
         my_name = my_profile.get("name", "I")
@@ -134,9 +333,10 @@ Generate {count} different first messages that:
 Return ONLY the messages, one per line, no numbering, no extra text.
 """
 
-        response = self._generate(prompt, system=system, max_tokens=200)
+        response = self._generate(prompt, system=system, max_tokens=200, on_token=on_token, cancelled=cancelled,
+                                  priority=priority)
         if not response:
-            return self.generate_icebreakers(my_profile, their_profile, count)  # fallback
+            return self._fallback_icebreakers(their_profile, count)
 
         # Split lines, clean up
         lines = [line.strip() for line in response.split("\n") if line.strip()]
@@ -152,6 +352,63 @@ Return ONLY the messages, one per line, no numbering, no extra text.
 
         # Ensure we return at most `count`
         if not cleaned:
-            return self.generate_icebreakers(my_profile, their_profile, count)
+            return self._fallback_icebreakers(their_profile, count)
+        ai_cache.put(key, cleaned[:count])
         return cleaned[:count]
-        
\ No newline at end of file
+
+    def _fallback_icebreakers(self, their_profile: Dict, count: int) -> List[str]:
+        name = their_profile.get("name", "there")
+        return [
+            f"Hey {name}! Your profile really stood out to me—how's your week going?",
+            f"Hi {name}, I saw you're into {', '.join(their_profile.get('interests', [])[:1]) or 'interesting things'}. What got you into that?",
+            f"Hey {name}, if we grabbed coffee tomorrow, what would you be most excited to talk about?"
+        ][:count]
+        
+
+# Per-call overhead against a local stub Ollama: python services/ai_service.py [calls]
+if __name__ == '__main__':
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StubOllama(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True
+        connections = set()
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload: Dict) -> None:
+            StubOllama.connections.add(self.client_address)
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({'models': []})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._reply({'response': 'Stub answer that is long enough'})
+
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubOllama)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{stub.server_port}"
+    body = {"model": "stub", "prompt": "hi", "stream": False}
+
+    def bench(label: str, call) -> None:
+        StubOllama.connections.clear()
+        call()  # warm up
+        start = time.perf_counter()
+        for _ in range(calls):
+            call()
+        per_call = (time.perf_counter() - start) / calls * 1e6
+        print(f"{label:<28} {per_call:8.0f} us/call  ({len(StubOllama.connections)} connections)")
+
+    bench("requests.post (no pooling)", lambda: requests.post(f"{url}/api/generate", json=body, timeout=GENERATE_TIMEOUT))
+    ai = DailyMatchAI(base_url=url, model="stub")
+    bench("DailyMatchAI._generate", lambda: ai._generate("hi"))
@@ -0,0 +1,144 @@
+"""
+ARCHIVE SERVICE
+Moves old and orphaned chat messages out of the hot `messages` table into
+compressed per-conversation files, and reads them back when a thread is paged back.
+
+Usage:
+    python services/archive_service.py [--days N] [--vacuum]
+"""
+
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(str(backend_dir), 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+
+COLUMNS = ('id', 'sender_id', 'receiver_id', 'text', 'created_at', 'read')
+
+
+def _pair(user1: int, user2: int) -> Tuple[int, int]:
+    user1, user2 = int(user1), int(user2)
+    return (user1, user2) if user1 <= user2 else (user2, user1)
+
+
+def archive_path(user1: int, user2: int) -> str:
+    low, high = _pair(user1, user2)
+    return os.path.join(ARCHIVE_DIR, f"{low}_{high}.jsonl.gz")
+
+
+@lru_cache(maxsize=64)
+def _load(path: str, mtime: float) -> Tuple[Dict, ...]:
+    """All archived messages of one conversation, oldest first (cached per file version)"""
+    seen = set()
+    rows = []
+    # Appends add gzip members; gzip reads them back as one stream
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            # A crash between append and delete can archive a message twice
+            if row['id'] not in seen:
+                seen.add(row['id'])
+                rows.append(row)
+    rows.sort(key=lambda r: r['id'])
+    return tuple(rows)
+
+
+def read_archived(user1: int, user2: int, before_id=None, limit: int = 50) -> Tuple[List[Dict], bool]:
+    """
+    Up to `limit` archived messages older than before_id, newest first,
+    plus whether even older ones exist.
+    """
+    path = archive_path(user1, user2)
+    try:
+        rows = _load(path, os.path.getmtime(path))
+    except FileNotFoundError:
+        return [], False
+
+    if before_id is not None:
+        rows = [r for r in rows if r['id'] < int(before_id)]
+    page = list(reversed(rows[-limit:])) if limit > 0 else []
+    return page, len(rows) > limit
+
+
+def _append(user1: int, user2: int, rows: List[Dict]) -> None:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with gzip.open(archive_path(user1, user2), 'at', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_messages(days: int = ARCHIVE_AFTER_DAYS) -> Dict[str, int]:
+    """
+    Archive messages older than `days`, plus every message of conversations
+    whose match no longer exists (unmatched users).
+    Files are written and synced before the rows are deleted.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    stats = {'conversations': 0, 'messages': 0}
+
+    with get_db() as conn:
+        conversations = conn.execute("""
+            SELECT lo, hi, NOT EXISTS (
+                SELECT 1 FROM matches mt
+                WHERE (mt.user1_id = lo AND mt.user2_id = hi)
+                   OR (mt.user1_id = hi AND mt.user2_id = lo)
+            ) AS orphaned
+            FROM (
+                SELECT DISTINCT MIN(sender_id, receiver_id) AS lo, MAX(sender_id, receiver_id) AS hi
+                FROM messages
+            )
+        """).fetchall()
+
+    for conv in conversations:
+        lo, hi = conv['lo'], conv['hi']
+        query = f"""
+            SELECT {', '.join(COLUMNS)} FROM messages
+            WHERE ((sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?))
+        """
+        params = [lo, hi, hi, lo]
+        if not conv['orphaned']:
+            query += " AND created_at < ?"
+            params.append(cutoff)
+        query += " ORDER BY id"
+
+        with get_db() as conn:
+            rows = [dict(r) for r in conn.execute(query, params).fetchall()]
+            if not rows:
+                continue
+
+            _append(lo, hi, rows)
+            conn.executemany("DELETE FROM messages WHERE id = ?", [(r['id'],) for r in rows])
+
+        stats['conversations'] += 1
+        stats['messages'] += len(rows)
+
+    return stats
+
+
+if __name__ == '__main__':
+    days = ARCHIVE_AFTER_DAYS
+    if '--days' in sys.argv:
+        days = int(sys.argv[sys.argv.index('--days') + 1])
+
+    stats = archive_messages(days)
+    print(f"✅ Archived {stats['messages']} messages from {stats['conversations']} conversations")
+
+    if '--vacuum' in sys.argv:
+        # Give the freed pages back so the hot table stays compact on disk
+        conn = get_db()
+        conn.execute("VACUUM")
+        conn.close()
+        print("✅ Database vacuumed")
@@ -0,0 +1,192 @@
+"""
+IMAGE PIPELINE
+Renditions of uploaded photos, built off the request path
+
+Each upload gets fixed-size renditions (thumb / feed / full) in a modern
+format (WebP by default, IMAGE_FORMAT=AVIF where Pillow supports it), written
+next to the original under renditions/<size>/. EXIF is dropped from the
+renditions. Originals are stripped by strip() while still an upload, before
+photo_store names them by their hash, and are never rewritten afterwards.
+Work runs in a small pool; under eventlet the pixel crunching goes to native
+threads (tpool) so chat sockets keep running.
+
+Pillow is in requirements.txt. An install without it still runs, but uploads
+are kept as-is, EXIF (GPS) included, and the original is served for every
+size, so a warning is printed at startup.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.photo_urls import SIZES
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("❌ Pillow is not installed: uploads keep their EXIF (GPS) and get no renditions")
+
+try:
+    from eventlet import tpool
+    from eventlet.patcher import is_monkey_patched
+except ImportError:
+    tpool = None
+
+# Longest edge in pixels; images are never upscaled
+RENDITIONS: Dict[str, int] = {'thumb': 160, 'feed': 720, 'full': 1440}
+QUALITY: Dict[str, int] = {'thumb': 70, 'feed': 75, 'full': 82}
+assert set(RENDITIONS) == set(SIZES)
+
+IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'WEBP').upper()
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+EXTENSIONS = {'WEBP': 'webp', 'AVIF': 'avif', 'JPEG': 'jpg'}
+MIMETYPES = {'WEBP': 'image/webp', 'AVIF': 'image/avif', 'JPEG': 'image/jpeg'}
+EXIF_ORIENTATION = 0x0112
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def rendition_path(original: str, size: str) -> str:
+    """Where the given size of an original upload lives (whether or not it exists yet)"""
+    directory, name = os.path.split(original)
+    return os.path.join(directory, 'renditions', size, f"{name}.{EXTENSIONS[IMAGE_FORMAT]}")
+
+
+def rendition_mimetype() -> str:
+    return MIMETYPES[IMAGE_FORMAT]
+
+
+def _save_atomic(image, path: str, **params) -> None:
+    # Readers never see a half-written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{threading.get_ident()}"
+    try:
+        image.save(tmp, **params)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def strip_metadata(path: str) -> bool:
+    """
+    Rewrite an image without its EXIF (GPS, camera), orientation applied to
+    the pixels first; True if the file changed. Animations are left alone.
+    """
+    with Image.open(path) as im:
+        im.load()
+        if 'exif' not in im.info or getattr(im, 'is_animated', False):
+            return False
+        source_format = im.format
+        if source_format == 'JPEG' and im.getexif().get(EXIF_ORIENTATION, 1) == 1:
+            # Keep the original quantization when no rotation re-encodes pixels anyway
+            _save_atomic(im, path, format='JPEG', quality='keep', optimize=True)
+            return True
+        image = ImageOps.exif_transpose(im)
+    params = {'quality': 92, 'optimize': True} if source_format == 'JPEG' else {}
+    _save_atomic(image, path, format=source_format, **params)
+    return True
+
+
+def process(original: str) -> Dict[str, str]:
+    """Write every rendition of an original; returns {size: path}"""
+    with Image.open(original) as im:
+        im.load()
+        image = ImageOps.exif_transpose(im)
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    if IMAGE_FORMAT == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+
+    written = {}
+    for size, edge in RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail((edge, edge), Image.LANCZOS)
+        path = rendition_path(original, size)
+        _save_atomic(rendition, path, format=IMAGE_FORMAT, quality=QUALITY[size])
+        written[size] = path
+    return written
+
+
+def _native(func, *args):
+    # Under eventlet, off the hub so other greenlets keep running
+    if tpool and is_monkey_patched('thread'):
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
+def render(original: str) -> Dict[str, str]:
+    """process() on a native thread when running under eventlet; errors propagate"""
+    return _native(process, original)
+
+
+def strip(path: str) -> bool:
+    """
+    strip_metadata() for an upload that isn't stored yet; False (file kept
+    as-is) without Pillow or when Pillow can't read it. Never call it on a
+    stored file: its name is the hash of its content.
+    """
+    if not available():
+        return False
+    try:
+        return _native(strip_metadata, path)
+    except Exception as e:
+        print(f"❌ Could not strip metadata from {path}: {e}")
+        return False
+
+
+def _run(original: str) -> Dict[str, str]:
+    try:
+        return render(original)
+    except Exception as e:
+        print(f"❌ Image processing failed for {original}: {e}")
+        return {}
+
+
+def submit(original: str) -> Optional[Future]:
+    """Queue renditions for a freshly saved upload; returns immediately"""
+    global _executor
+    if not available():
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+    return _executor.submit(_run, original)
+
+
+def remove(original: str) -> None:
+    """Delete an original's renditions (best effort)"""
+    for size in RENDITIONS:
+        try:
+            os.remove(rendition_path(original, size))
+        except FileNotFoundError:
+            pass
+
+
+# Process (or re-process) existing uploads: python services/image_pipeline.py <file>...
+if __name__ == '__main__':
+    import time
+
+    if not available():
+        sys.exit("Pillow is not installed")
+    for path in sys.argv[1:]:
+        before = os.path.getsize(path)
+        start = time.perf_counter()
+        out = process(path)
+        took = (time.perf_counter() - start) * 1000
+        sizes = ', '.join(f"{size} {os.path.getsize(p) // 1024}KB" for size, p in out.items())
+        print(f"{path}: {before // 1024}KB -> {sizes} ({took:.0f}ms)")
@@ -0,0 +1,243 @@
+"""
+JOB QUEUE
+Background jobs backed by the `jobs` table; no broker needed
+
+enqueue() is called on the request path and writes one row. Workers, either
+threads inside the app (JobWorker.start) or a separate process (worker.py),
+claim due jobs in priority order under a lease. A job whose handler raises is
+retried with exponential backoff. After max_attempts it is kept as 'dead' until
+requeue_dead(). A worker that dies mid-job loses its lease, and the job is
+claimed again once the lease expires. Each job type can cap how many of its
+jobs run at once across all workers.
+
+Handlers register with @job('type') and receive the job's JSON payload.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db
+
+LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 5))
+BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 3600))
+
+# Higher runs first (the same convention as services/ai_scheduler.py)
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+
+class JobType:
+    def __init__(self, name: str, handler: Callable, concurrency: Optional[int] = None,
+                 max_attempts: int = MAX_ATTEMPTS, lease_seconds: int = LEASE_SECONDS):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+
+
+# Registered job types by name
+registry: Dict[str, JobType] = {}
+
+
+def job(name: str, concurrency: Optional[int] = None, max_attempts: int = MAX_ATTEMPTS,
+        lease_seconds: int = LEASE_SECONDS):
+    """
+    Register a handler:
+
+        @job('email.verification', concurrency=2)
+        def send(payload): ...
+
+    concurrency caps running jobs of this type across all workers (None: no cap);
+    lease_seconds should comfortably exceed the handler's longest run.
+    """
+    def decorator(handler: Callable) -> Callable:
+        registry[name] = JobType(name, handler, concurrency, max_attempts, lease_seconds)
+        return handler
+    return decorator
+
+
+def enqueue(job_type: str, payload=None, priority: int = PRIORITY_NORMAL, delay: float = 0,
+            unique_key: Optional[str] = None, conn=None) -> Optional[int]:
+    """
+    Queue a job; returns its id. Higher priority runs first. With unique_key,
+    nothing is queued (None is returned) while a job with that key is still
+    queued or running. Pass conn to enqueue inside the caller's transaction.
+    """
+    spec = registry.get(job_type)
+    now = time.time()
+    params = (job_type, json.dumps(payload), priority, spec.max_attempts if spec else MAX_ATTEMPTS,
+              now + delay, unique_key, now, now)
+    sql = """
+        INSERT INTO jobs (type, payload, priority, max_attempts, run_at, unique_key, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (unique_key) WHERE status IN ('queued', 'running') DO NOTHING
+    """
+    if conn is not None:
+        cursor = conn.execute(sql, params)
+        return cursor.lastrowid if cursor.rowcount else None
+    with get_db() as own:
+        cursor = own.execute(sql, params)
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+def backoff(attempts: int) -> float:
+    """Seconds before retry number `attempts` (with jitter so failures don't retry in lockstep)"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.75, 1.25)
+
+
+class JobWorker:
+    """
+    Claims and runs jobs of the given types (default: every registered type).
+    run_pending() works the queue on the calling thread; start() runs it on a
+    pool of daemon threads, as NotificationService does.
+    """
+
+    def __init__(self, types: Optional[Iterable[str]] = None, workers: int = 2,
+                 poll_interval: float = 1.0):
+        self.types = list(types) if types else None
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def _claimable(self) -> List[str]:
+        return [name for name in (self.types or registry) if name in registry]
+
+    def claim(self) -> Optional[Dict]:
+        """Atomically lease the most urgent due job this worker may run, or return None"""
+        types = self._claimable()
+        if not types:
+            return None
+        now = time.time()
+        with get_db() as conn:
+            # The write lock makes the concurrency check and the claim one step across processes
+            conn.execute("BEGIN IMMEDIATE")
+            capped = [name for name in types if registry[name].concurrency is not None]
+            if capped:
+                running = dict(conn.execute(f"""
+                    SELECT type, COUNT(*) FROM jobs
+                    WHERE status = 'running' AND lease_until >= ? AND type IN ({', '.join('?' for _ in capped)})
+                    GROUP BY type
+                """, [now] + capped).fetchall())
+                types = [name for name in types
+                         if registry[name].concurrency is None or running.get(name, 0) < registry[name].concurrency]
+                if not types:
+                    return None
+
+            placeholders = ', '.join('?' for _ in types)
+            row = conn.execute(f"""
+                SELECT id, type FROM jobs
+                WHERE type IN ({placeholders}) AND (
+                    (status = 'queued' AND run_at <= ?)
+                    OR (status = 'running' AND lease_until < ?)
+                )
+                ORDER BY priority DESC, run_at, id LIMIT 1
+            """, types + [now, now]).fetchone()
+            if not row:
+                return None
+
+            token = uuid.uuid4().hex
+            claimed = conn.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?,
+                                lease_token = ?, worker = ?, updated_at = ?
+                WHERE id = ?
+                RETURNING *
+            """, (now + registry[row['type']].lease_seconds, token, self.name, now, row['id'])).fetchone()
+            return dict(claimed)
+
+    def _finish(self, entry: Dict, error: Optional[str]) -> None:
+        now = time.time()
+        # The lease token guards against a worker whose lease expired and was taken over
+        with get_db() as conn:
+            if error is None:
+                conn.execute("DELETE FROM jobs WHERE id = ? AND lease_token = ?", (entry['id'], entry['lease_token']))
+            elif entry['attempts'] >= entry['max_attempts']:
+                conn.execute("""
+                    UPDATE jobs SET status = 'dead', last_error = ?, lease_until = NULL, updated_at = ?
+                    WHERE id = ? AND lease_token = ?
+                """, (error, now, entry['id'], entry['lease_token']))
+                print(f"❌ Job {entry['id']} ({entry['type']}) failed permanently: {error.splitlines()[-1]}")
+            else:
+                conn.execute("""
+                    UPDATE jobs SET status = 'queued', last_error = ?, run_at = ?, lease_until = NULL, updated_at = ?
+                    WHERE id = ? AND lease_token = ?
+                """, (error, now + backoff(entry['attempts']), now, entry['id'], entry['lease_token']))
+
+    def execute(self, entry: Dict) -> bool:
+        """Run one claimed job; True if it succeeded"""
+        try:
+            registry[entry['type']].handler(json.loads(entry['payload']))
+        except Exception:
+            self._finish(entry, traceback.format_exc(limit=5))
+            return False
+        self._finish(entry, None)
+        return True
+
+    def run_pending(self, limit: int = 100) -> int:
+        """Run up to `limit` due jobs on the calling thread; returns how many ran"""
+        ran = 0
+        while ran < limit and not self._stop.is_set():
+            entry = self.claim()
+            if not entry:
+                break
+            self.execute(entry)
+            ran += 1
+        return ran
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.run_pending():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"jobs-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+
+def requeue_dead(job_type: Optional[str] = None) -> int:
+    """Give dead-lettered jobs a fresh set of attempts; returns how many"""
+    now = time.time()
+    with get_db() as conn:
+        return conn.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, updated_at = ?
+            WHERE status = 'dead' AND (? IS NULL OR type = ?)
+        """, (now, now, job_type, job_type)).rowcount
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """{type: {'queued': n, 'running': n, 'dead': n}}"""
+    result: Dict[str, Dict[str, int]] = {}
+    with get_db() as conn:
+        for row in conn.execute("SELECT type, status, COUNT(*) AS n FROM jobs GROUP BY type, status"):
+            result.setdefault(row['type'], {'queued': 0, 'running': 0, 'dead': 0})[row['status']] = row['n']
+    return result
@@ -0,0 +1,63 @@
+"""
+JOBS
+Handlers for background work, run by services/job_queue.py workers
+
+Importing this module registers them; enqueue with job_queue.enqueue(type, payload).
+"""
+
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models import profile_content
+from models.database import get_db
+from services import ai_cache, archive_service, image_pipeline, photo_store
+from services.ai_scheduler import PRIORITY_BACKGROUND
+from services.ai_service import DailyMatchAI
+from services.job_queue import job
+
+_ai = None
+
+
+@job('image.renditions', concurrency=image_pipeline.IMAGE_WORKERS)
+def build_renditions(payload):
+    """Re-render one stored photo: {'ref': ...}"""
+    image_pipeline.render(photo_store.path_for(payload['ref']))
+
+
+@job('photos.collect', concurrency=1)
+def collect_photos(payload):
+    """Delete unreferenced uploads: {'grace_seconds': ...} (optional)"""
+    removed = photo_store.collect(payload.get('grace_seconds', photo_store.ORPHAN_GRACE_SECONDS))
+    print(f"✅ Removed {removed} unreferenced photos")
+
+
+@job('messages.archive', concurrency=1, lease_seconds=3600)
+def archive_messages(payload):
+    """Move old messages to the archive: {'days': ...} (optional)"""
+    result = archive_service.archive_messages(payload.get('days', archive_service.ARCHIVE_AFTER_DAYS))
+    print(f"✅ Archived messages: {result}")
+
+
+@job('ai_cache.prune', concurrency=1)
+def prune_ai_cache(payload):
+    """Expire and evict cached AI outputs"""
+    print(f"✅ Pruned {ai_cache.prune()} AI cache entries")
+
+
+@job('ai.icebreakers', concurrency=1)
+def precompute_icebreakers(payload):
+    """Warm the AI cache with openers for a new match: {'user_id': ..., 'other_id': ...}"""
+    global _ai
+    if _ai is None:
+        _ai = DailyMatchAI()
+    conn = get_db()
+    try:
+        me = profile_content.icebreaker_profile(conn, payload['user_id'])
+        them = profile_content.icebreaker_profile(conn, payload['other_id'])
+    finally:
+        conn.close()
+    # Queued behind any interactive request, so users in the app are never kept waiting
+    _ai.generate_icebreakers(me, them, count=3, priority=PRIORITY_BACKGROUND)
@@ -4,7 +4,6 @@ Finds potential matches and computes compatibility scores
 """
 
 from typing import List, Dict
-import json
 import sys
 from pathlib import Path
 
@@ -40,8 +39,8 @@ class MatchingService:
         score = 0.0
 
         # Interests overlap
-        my_interests = set(json.loads(me.interests) if me.interests else [])
-        their_interests = set(json.loads(them.interests) if them.interests else [])
+        my_interests = set(me.decoded('interests'))
+        their_interests = set(them.decoded('interests'))
         if my_interests and their_interests:
             overlap = len(my_interests & their_interests)
             union = len(my_interests | their_interests)
@@ -110,6 +109,8 @@ class MatchingService:
             """, (user_id,)).fetchall()
 
             candidates = [Profile(**dict(row)) for row in rows]
+            # Interests for every candidate in one query, not one per compute_score
+            Profile.load_content(conn, candidates)
 
         results = []
 
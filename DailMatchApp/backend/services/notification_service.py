@@ -0,0 +1,194 @@
+"""
+NOTIFICATION SERVICE
+Queues chat notifications for offline recipients and dispatches them in the background
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db
+
+# Messages from the same match arriving within this window become one notification
+COALESCE_SECONDS = int(os.environ.get('NOTIFY_COALESCE_SECONDS', 30))
+MAX_ATTEMPTS = 5
+
+
+class StdoutTransport:
+    """Prints notifications; the default for local development"""
+
+    def send(self, notification: Dict) -> bool:
+        print(f"🔔 Notify user {notification['user_id']}: {notification['title']} - {notification['body']}")
+        return True
+
+
+class FileTransport:
+    """Appends notifications as JSON lines to a file (handy for tests)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notification: Dict) -> bool:
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(notification) + '\n')
+        return True
+
+
+def transport_from_env():
+    """
+    Pick a transport from NOTIFY_TRANSPORT:
+        stdout (default) or file:<path>
+    Push providers plug in as any object with send(notification) -> bool.
+    """
+    spec = os.environ.get('NOTIFY_TRANSPORT', 'stdout')
+    if spec.startswith('file:'):
+        return FileTransport(spec[len('file:'):])
+    return StdoutTransport()
+
+
+class NotificationService:
+    """
+    Durable, coalescing notification queue backed by the notification_queue table.
+
+    enqueue_message() is called on the request path and only touches one row;
+    worker threads pick up entries once their coalescing window has closed.
+    """
+
+    def __init__(self, transport=None, workers: int = 2, poll_interval: float = 1.0,
+                 coalesce_seconds: int = COALESCE_SECONDS):
+        self.transport = transport or StdoutTransport()
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.coalesce_seconds = coalesce_seconds
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def enqueue_message(self, user_id: int, match_id: int, sender_id: int, text: str) -> None:
+        """Queue (or fold into a pending) notification for a new chat message"""
+        now = datetime.now()
+        with get_db() as conn:
+            cursor = conn.execute("""
+                UPDATE notification_queue
+                SET message_count = message_count + 1, preview = ?, sender_id = ?, updated_at = ?
+                WHERE user_id = ? AND match_id = ? AND status = 'pending'
+            """, (text, sender_id, now, user_id, match_id))
+
+            if cursor.rowcount == 0:
+                conn.execute("""
+                    INSERT INTO notification_queue (
+                        user_id, match_id, sender_id, preview, message_count,
+                        status, attempts, created_at, updated_at
+                    ) VALUES (?, ?, ?, ?, 1, 'pending', 0, ?, ?)
+                """, (user_id, match_id, sender_id, text, now, now))
+
+    def cancel_pending(self, user_id: int, match_id: int) -> None:
+        """Drop pending notifications once the user is back in the conversation"""
+        with get_db() as conn:
+            conn.execute("""
+                DELETE FROM notification_queue
+                WHERE user_id = ? AND match_id = ? AND status = 'pending'
+            """, (user_id, match_id))
+
+    def _claim(self) -> Optional[Dict]:
+        """Atomically take one due entry, or return None"""
+        due_before = datetime.now() - timedelta(seconds=self.coalesce_seconds)
+        with get_db() as conn:
+            row = conn.execute("""
+                SELECT * FROM notification_queue
+                WHERE status = 'pending' AND created_at <= ?
+                ORDER BY id LIMIT 1
+            """, (due_before,)).fetchone()
+            if not row:
+                return None
+
+            claimed = conn.execute("""
+                UPDATE notification_queue SET status = 'sending'
+                WHERE id = ? AND status = 'pending'
+            """, (row['id'],)).rowcount
+            if not claimed:
+                return None
+            return dict(row)
+
+    def _build(self, entry: Dict) -> Dict:
+        count = entry['message_count']
+        with get_db() as conn:
+            sender = conn.execute(
+                "SELECT first_name, username FROM users WHERE id = ?", (entry['sender_id'],)
+            ).fetchone()
+        name = (sender['first_name'] or sender['username']) if sender else 'Your match'
+
+        return {
+            'user_id': entry['user_id'],
+            'match_id': entry['match_id'],
+            'title': name,
+            'body': entry['preview'] if count == 1 else f"{count} new messages",
+            'count': count,
+        }
+
+    def _deliver(self, entry: Dict) -> None:
+        try:
+            ok = self.transport.send(self._build(entry))
+        except Exception as e:
+            print(f"Notification error: {e}")
+            ok = False
+
+        with get_db() as conn:
+            if ok:
+                conn.execute("DELETE FROM notification_queue WHERE id = ?", (entry['id'],))
+            elif entry['attempts'] + 1 >= MAX_ATTEMPTS:
+                conn.execute("""
+                    UPDATE notification_queue SET status = 'failed', attempts = attempts + 1
+                    WHERE id = ?
+                """, (entry['id'],))
+            else:
+                conn.execute("""
+                    UPDATE notification_queue SET status = 'pending', attempts = attempts + 1
+                    WHERE id = ?
+                """, (entry['id'],))
+
+    def dispatch_due(self, limit: int = 100) -> int:
+        """Deliver up to `limit` due notifications on the calling thread"""
+        sent = 0
+        while sent < limit:
+            entry = self._claim()
+            if not entry:
+                break
+            self._deliver(entry)
+            sent += 1
+        return sent
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.dispatch_due():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"Notification worker error: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Start the worker pool; entries left 'sending' by a crash are requeued"""
+        with get_db() as conn:
+            conn.execute("UPDATE notification_queue SET status = 'pending' WHERE status = 'sending'")
+
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"notify-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
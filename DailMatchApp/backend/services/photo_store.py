@@ -0,0 +1,295 @@
+"""
+PHOTO STORE
+Content-addressed storage for uploaded photos
+
+A photo's reference is "<sha256>.<ext>", and the file lives under two levels
+of shard directories (ab/cd/abcd….jpg), so identical uploads are stored once
+and names never collide. EXIF (GPS, camera) is stripped before an upload is
+hashed, so a stored file is never rewritten. Uploads are parsed straight into
+a temp file in the store (UploadRequest), hashed, size-checked and sniffed
+chunk by chunk, so an upload costs a constant amount of memory however large
+it is, and one over MAX_PHOTO_SIZE (by default the app's MAX_CONTENT_LENGTH)
+is refused with 413 as soon as it crosses the limit.
+
+References are counted in photo_refs. Triggers keep the counts in step with
+profile_photos and image messages (see init_photo_refs in models/database.py).
+A file is deleted once nothing has referenced it for ORPHAN_GRACE_SECONDS,
+so an identical upload that is stored but not yet attached keeps its file.
+collect() sweeps these; release() applies the same check to a single ref.
+
+Because a hashed file never changes, send_photo() marks it cacheable for a
+year and immutable. Conditional and Range requests are answered without
+reading the file. PHOTO_SENDFILE hands the bytes to the front proxy instead:
+'x-accel' for nginx (PHOTO_ACCEL_PREFIX an internal location aliased to
+UPLOAD_DIR) or 'x-sendfile' for Apache/lighttpd. The app then only checks the
+link and sets headers.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Request, abort, current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from werkzeug.wsgi import FileWrapper
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db
+from services import image_pipeline
+from utils.validation import (SNIFF_BYTES, sniff_image_type, validate_file_content,
+                              validate_file_extension, validate_file_size)
+
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', os.path.join(str(backend_dir), 'uploads'))
+CHUNK_SIZE = 64 * 1024
+# Defaults to the app's MAX_CONTENT_LENGTH (see init_uploads), the only cap uploads ever had
+MAX_PHOTO_SIZE = int(os.environ.get('MAX_PHOTO_SIZE', 16 * 1024 * 1024))
+# Unreferenced uploads younger than this are left alone (the profile/message row may be on its way)
+ORPHAN_GRACE_SECONDS = int(os.environ.get('PHOTO_ORPHAN_GRACE', 3600))
+
+PHOTO_SENDFILE = os.environ.get('PHOTO_SENDFILE', '').lower()
+PHOTO_ACCEL_PREFIX = os.environ.get('PHOTO_ACCEL_PREFIX', '/protected-uploads/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Pre-hash uploads could in principle be overwritten under the same name
+LEGACY_MAX_AGE = 24 * 3600
+
+HASHED_REF = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def is_hashed(ref: str) -> bool:
+    return bool(HASHED_REF.match(ref))
+
+
+def path_for(ref: str) -> str:
+    """Filesystem path of a reference (pre-hash uploads keep their old place in UPLOAD_DIR)"""
+    if is_hashed(ref):
+        return os.path.join(UPLOAD_DIR, ref[:2], ref[2:4], ref)
+    return safe_join(UPLOAD_DIR, ref) or os.path.join(UPLOAD_DIR, os.path.basename(ref))
+
+
+def _file_wrapper(file, buffer_size: int = CHUNK_SIZE):
+    # eventlet's WSGI server offers no sendfile; at least move the bytes in large chunks
+    return FileWrapper(file, max(buffer_size, CHUNK_SIZE))
+
+
+def send_photo(path: str, mimetype: Optional[str] = None, immutable: bool = True,
+               max_age: int = LEGACY_MAX_AGE):
+    """Response for a file under UPLOAD_DIR (immutable ones are cached for a year)"""
+    if not os.path.isfile(path):
+        abort(404)
+    if immutable:
+        max_age = IMMUTABLE_MAX_AGE
+
+    if PHOTO_SENDFILE == 'x-accel':
+        # nginx serves the bytes, ranges and conditionals from the internal location
+        response = current_app.response_class(mimetype=mimetype or mimetypes.guess_type(path)[0])
+        response.headers['X-Accel-Redirect'] = (PHOTO_ACCEL_PREFIX.rstrip('/') + '/'
+                                                + quote(os.path.relpath(path, UPLOAD_DIR)))
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        environ = request.environ
+        environ.setdefault('wsgi.file_wrapper', _file_wrapper)
+        response = send_file(path, environ, mimetype=mimetype, conditional=True, max_age=max_age,
+                             use_x_sendfile=PHOTO_SENDFILE == 'x-sendfile',
+                             response_class=current_app.response_class)
+    response.cache_control.immutable = immutable
+    return response
+
+
+def _hash_file(path: str):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest, os.path.getsize(path)
+
+
+class UploadSpool:
+    """
+    Temp file in the store that an upload is written straight into.
+    The hash, size and leading bytes are taken as the chunks arrive, so
+    validation needs no second pass and an oversized file is cut off as soon
+    as it crosses the limit. Closing an uncommitted spool deletes it.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        tmp_dir = os.path.join(UPLOAD_DIR, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, 'w+b')
+        self.max_size = max_size or MAX_PHOTO_SIZE
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        valid, message = validate_file_size(self.size, self.max_size)
+        if not valid:
+            self.close()
+            raise RequestEntityTooLarge(message)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+        self.digest.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush... go to the file (werkzeug rewinds it after parsing)
+        return getattr(self._file, name)
+
+    def commit(self, extension: str) -> str:
+        """Strip metadata, then move the spooled file into the store; returns its reference"""
+        self._file.close()
+        if image_pipeline.strip(self.name):
+            self.digest, self.size = _hash_file(self.name)
+        ref = f"{self.digest.hexdigest()}.{extension}"
+        path = path_for(ref)
+        if os.path.exists(path):
+            os.remove(self.name)
+            return _register(ref, self.size, created=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.name, path)
+        return _register(ref, self.size, created=True)
+
+    def close(self) -> None:
+        self._file.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class UploadRequest(Request):
+    """Request whose file uploads spool straight into the store (see init_uploads)"""
+
+    max_form_parts = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spools = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool()
+        self._spools.append(spool)
+        return spool
+
+    def close(self) -> None:
+        # Includes spools of an upload aborted mid-parse, which never reached request.files
+        super().close()
+        for spool in self._spools:
+            spool.close()
+
+
+def init_uploads(app) -> None:
+    global MAX_PHOTO_SIZE
+    app.request_class = UploadRequest
+    if 'MAX_PHOTO_SIZE' not in os.environ and app.config.get('MAX_CONTENT_LENGTH'):
+        MAX_PHOTO_SIZE = app.config['MAX_CONTENT_LENGTH']
+
+
+def store(stream, extension: str, max_size: Optional[int] = None) -> Optional[str]:
+    """
+    Copy a file-like stream into the store; returns its reference, or None if
+    it isn't an allowed image. An identical file already stored is reused.
+    """
+    spool = stream if isinstance(stream, UploadSpool) else None
+    if spool is None:
+        spool = UploadSpool(max_size)
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            raise
+
+    valid, _ = validate_file_content(spool.head)
+    if not valid:
+        spool.close()
+        return None
+    # The sniffed type names the file, not the client's claimed extension
+    return spool.commit(sniff_image_type(spool.head) or extension.lower())
+
+
+def save_upload(file) -> Optional[str]:
+    """Store an uploaded werkzeug FileStorage; None if it isn't an allowed image"""
+    if not file:
+        return None
+    valid, _ = validate_file_extension(file.filename)
+    if not valid:
+        file.stream.close()
+        return None
+    return store(file.stream, file.filename.rsplit('.', 1)[1])
+
+
+def _register(ref: str, size: int, created: bool) -> str:
+    with get_db() as conn:
+        conn.execute("""
+            INSERT INTO photo_refs (ref, refcount, size, updated_at) VALUES (?, 0, ?, ?)
+            ON CONFLICT(ref) DO UPDATE SET updated_at = excluded.updated_at
+        """, (ref, size, int(time.time())))
+    if created:
+        image_pipeline.submit(path_for(ref))
+    return ref
+
+
+def _delete_files(ref: str) -> None:
+    path = path_for(ref)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    image_pipeline.remove(path)
+
+
+def release(ref: str, grace_seconds: int = ORPHAN_GRACE_SECONDS) -> bool:
+    """Delete ref's file if it has been unreferenced for the grace period; True if deleted"""
+    cutoff = int(time.time()) - grace_seconds
+    with get_db() as conn:
+        deleted = conn.execute(
+            "DELETE FROM photo_refs WHERE ref = ? AND refcount <= 0 AND updated_at <= ?",
+            (ref, cutoff)).rowcount
+    if not deleted:
+        return False  # Still in use or recently touched; collect() picks it up later
+    _delete_files(ref)
+    return True
+
+
+def collect(grace_seconds: int = ORPHAN_GRACE_SECONDS) -> int:
+    """Delete every unreferenced photo older than the grace period; returns how many"""
+    cutoff = int(time.time()) - grace_seconds
+    with get_db() as conn:
+        refs = [row['ref'] for row in conn.execute(
+            "SELECT ref FROM photo_refs WHERE refcount <= 0 AND updated_at <= ?", (cutoff,))]
+        conn.executemany("DELETE FROM photo_refs WHERE ref = ? AND refcount <= 0", [(r,) for r in refs])
+    for ref in refs:
+        _delete_files(ref)
+    return len(refs)
+
+
+def stats() -> dict:
+    with get_db() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*) AS photos, COALESCE(SUM(size), 0) AS bytes,
+                   COALESCE(SUM(refcount), 0) AS refs,
+                   COALESCE(SUM(refcount <= 0), 0) AS unreferenced
+            FROM photo_refs
+        """).fetchone()
+    return dict(row)
+
+
+# Garbage-collect orphaned uploads: python services/photo_store.py [grace_seconds]
+if __name__ == '__main__':
+    grace = int(sys.argv[1]) if len(sys.argv) > 1 else ORPHAN_GRACE_SECONDS
+    print(f"Removed {collect(grace)} unreferenced photos; {stats()}")
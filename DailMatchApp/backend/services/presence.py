@@ -0,0 +1,71 @@
+"""
+PRESENCE
+Tracks which users are connected to which chat rooms (in-process)
+"""
+
+import threading
+from typing import Dict, Set, Tuple
+
+_lock = threading.Lock()
+
+# room -> {user_id: {sid, ...}}
+_rooms: Dict[str, Dict[str, Set[str]]] = {}
+# sid -> (user_id, {room, ...})
+_sessions: Dict[str, Tuple[str, Set[str]]] = {}
+
+
+def joined(sid: str, room, user_id) -> None:
+    """Record that a socket session for user_id joined room"""
+    if user_id is None:
+        return
+    room, user_id = str(room), str(user_id)
+    with _lock:
+        _rooms.setdefault(room, {}).setdefault(user_id, set()).add(sid)
+        _sessions.setdefault(sid, (user_id, set()))[1].add(room)
+
+
+def left(sid: str, room) -> None:
+    room = str(room)
+    with _lock:
+        session = _sessions.get(sid)
+        if not session:
+            return
+        user_id, rooms = session
+        rooms.discard(room)
+        _remove(room, user_id, sid)
+
+
+def disconnected(sid: str) -> None:
+    with _lock:
+        session = _sessions.pop(sid, None)
+        if not session:
+            return
+        user_id, rooms = session
+        for room in rooms:
+            _remove(room, user_id, sid)
+
+
+def _remove(room: str, user_id: str, sid: str) -> None:
+    members = _rooms.get(room)
+    if not members:
+        return
+    sids = members.get(user_id)
+    if sids:
+        sids.discard(sid)
+        if not sids:
+            del members[user_id]
+    if not members:
+        del _rooms[room]
+
+
+def is_in_room(room, user_id) -> bool:
+    """True if user_id has at least one live session in room"""
+    with _lock:
+        return str(user_id) in _rooms.get(str(room), {})
+
+
+def is_online(user_id) -> bool:
+    """True if user_id has any live socket session"""
+    user_id = str(user_id)
+    with _lock:
+        return any(uid == user_id for uid, _ in _sessions.values())
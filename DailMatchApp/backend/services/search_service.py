@@ -0,0 +1,188 @@
+"""
+SEARCH SERVICE
+Full-text search over a user's chat history (SQLite FTS5)
+
+Usage:
+    python services/search_service.py rebuild          # re-index existing messages
+    python services/search_service.py bench [count]    # FTS vs LIKE on a scratch DB
+"""
+
+import html
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from models.database import get_db, has_message_search, rebuild_message_search
+
+HIGHLIGHT_START = '<b>'
+HIGHLIGHT_END = '</b>'
+MAX_PER_PAGE = 50
+
+# Messages the user sent or received in a conversation that is still a match
+_SCOPE = '''
+    JOIN matches mt
+      ON (mt.user1_id = m.sender_id AND mt.user2_id = m.receiver_id)
+      OR (mt.user1_id = m.receiver_id AND mt.user2_id = m.sender_id)
+    WHERE (m.sender_id = :user_id OR m.receiver_id = :user_id)
+'''
+
+
+def highlight(text: str, words: List[str]) -> str:
+    """
+    HTML-escaped text with each whole-word occurrence of `words` wrapped in
+    HIGHLIGHT_START/END. The text is escaped before the tags go in, so markup
+    typed into a message can never pass for (or break out of) a highlight.
+    """
+    if not text:
+        return ''
+    if not words:
+        return html.escape(text)
+    pattern = re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(w) for w in words) + r')(?!\w)', re.IGNORECASE)
+    parts, pos = [], 0
+    for m in pattern.finditer(text):
+        parts += [html.escape(text[pos:m.start()]), HIGHLIGHT_START, html.escape(m.group()), HIGHLIGHT_END]
+        pos = m.end()
+    parts.append(html.escape(text[pos:]))
+    return ''.join(parts)
+
+
+def to_match_query(text: str, user_id: int) -> str:
+    """
+    Turn free text into a safe FTS5 query limited to the user's messages,
+    where every word must appear. Prefix matching is left out on purpose:
+    expanding a prefix reads every matching term's doclist, which costs
+    tens of milliseconds at a few million messages.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return ''
+    terms = [f'"{w}"' for w in words]
+    return f'participants : "u{int(user_id)}" AND text : ({" ".join(terms)})'
+
+
+def search_messages(user_id: int, text: str, page: int = 1, per_page: int = 20) -> Dict:
+    """
+    Search the user's conversations, newest matches first.
+
+    Returns {'results': [...], 'page': n, 'hasMore': bool}; each result's
+    snippet is escaped HTML with the matched words in <b>.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    params = {
+        'user_id': user_id,
+        'limit': per_page + 1,
+        'offset': (page - 1) * per_page,
+    }
+
+    query = to_match_query(text, user_id)
+    if not query:
+        return {'results': [], 'page': page, 'hasMore': False}
+
+    with get_db() as conn:
+        if has_message_search(conn.cursor()):
+            params['query'] = query
+            # Plain-text window around the hits; highlight() marks them up safely
+            rows = conn.execute(f'''
+                SELECT m.id, m.sender_id, m.receiver_id, m.created_at, mt.id AS match_id,
+                       snippet(messages_fts, 0, '', '', '…', 12) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                {_SCOPE}
+                  AND messages_fts MATCH :query
+                ORDER BY messages_fts.rowid DESC
+                LIMIT :limit OFFSET :offset
+            ''', params).fetchall()
+        else:
+            # No FTS5 in this SQLite build: slow path, whole message as the snippet
+            params['pattern'] = f"%{text.strip()}%"
+            rows = conn.execute(f'''
+                SELECT m.id, m.sender_id, m.receiver_id, m.created_at, mt.id AS match_id,
+                       m.text AS snippet
+                FROM messages m
+                {_SCOPE}
+                  AND m.text LIKE :pattern
+                ORDER BY m.id DESC
+                LIMIT :limit OFFSET :offset
+            ''', params).fetchall()
+
+    words = re.findall(r'\w+', text)
+    results: List[Dict] = [{
+        '_id': str(row['id']),
+        'matchId': str(row['match_id']),
+        'senderId': str(row['sender_id']),
+        'snippet': highlight(row['snippet'], words),
+        'timestamp': row['created_at'],
+    } for row in rows[:per_page]]
+
+    return {'results': results, 'page': page, 'hasMore': len(rows) > per_page}
+
+
+def rebuild_index() -> None:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if not has_message_search(cursor):
+            print("❌ messages_fts does not exist (run init_db first, FTS5 required)")
+            return
+        rebuild_message_search(cursor)
+    print("✅ Message search index rebuilt")
+
+
+def _bench(count: int) -> None:
+    """Time FTS against LIKE on a throwaway database with `count` messages"""
+    import random
+    import tempfile
+    import time
+    import models.database as database
+
+    database.DB_NAME = tempfile.mktemp(suffix='.db')
+    database.init_db()
+
+    words = ('coffee hiking dinner movie tonight weekend museum concert beach tacos '
+             'brunch running book travel music dog cat pizza sunset yoga').split()
+    users = 2000
+
+    print(f"Inserting {count} messages...")
+    start = time.perf_counter()
+    with get_db() as conn:
+        conn.executemany("INSERT INTO matches (user1_id, user2_id) VALUES (?, ?)",
+                         [(u, u + 1) for u in range(1, users, 2)])
+        batch = []
+        for i in range(count):
+            u = random.randrange(1, users, 2)
+            sender, receiver = (u, u + 1) if i % 2 else (u + 1, u)
+            batch.append((sender, receiver, ' '.join(random.choices(words, k=8)) + f" msg{i}"))
+            if len(batch) == 50000:
+                conn.executemany("INSERT INTO messages (sender_id, receiver_id, text) VALUES (?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO messages (sender_id, receiver_id, text) VALUES (?, ?, ?)", batch)
+    print(f"  {time.perf_counter() - start:.1f}s (including index triggers)")
+
+    user_id = 1
+    for term in ('museum', 'sunset yoga', f"msg{count // 2}"):
+        start = time.perf_counter()
+        fts = search_messages(user_id, term)
+        fts_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with get_db() as conn:
+            conn.execute(f"SELECT m.id FROM messages m {_SCOPE} AND m.text LIKE :p LIMIT 21",
+                         {'user_id': user_id, 'p': f"%{term}%"}).fetchall()
+        like_ms = (time.perf_counter() - start) * 1000
+
+        print(f"  '{term}': fts {fts_ms:.1f}ms ({len(fts['results'])} hits), like {like_ms:.1f}ms")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'rebuild':
+        rebuild_index()
+    elif command == 'bench':
+        _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000)
+    else:
+        print(__doc__)
@@ -1,21 +1,41 @@
 import os
 import jwt
 import datetime
+import hashlib
+import time
+import uuid
+from functools import wraps
+from flask import request, jsonify, g
+
+from utils.cache import TTLCache
+from utils.sessions import registry
 
 # Secret key for JWT signing – use environment variable or default for development
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev_secret_key')
 ALGORITHM = 'HS256'
 EXPIRATION_HOURS = 24
 
+# Development only: accept the unauthenticated legacy ``User-Id`` header when
+# there's no bearer token. Anyone can send it, so never enable this in production.
+ALLOW_USER_ID_HEADER = os.getenv('ALLOW_USER_ID_HEADER', '').lower() in ('1', 'true', 'yes')
+
+# Verified tokens are remembered (by hash) so repeat requests skip HMAC + claim parsing
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+token_cache = TTLCache(maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 4096)), ttl=TOKEN_CACHE_TTL)
+
 
 def generate_token(user_id: int) -> str:
     """Generate a JWT token for the given user ID.
-    The token expires after ``EXPIRATION_HOURS`` hours.
+    The token expires after ``EXPIRATION_HOURS`` hours and is recorded in the
+    session registry under its ``jti`` so it can be revoked.
     """
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=EXPIRATION_HOURS)
     payload = {
         'user_id': user_id,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=EXPIRATION_HOURS)
+        'jti': uuid.uuid4().hex,
+        'exp': expires
     }
+    registry.register(payload['jti'], user_id, expires.timestamp())
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     # ``jwt.encode`` returns ``str`` in PyJWT>=2.0, but may return ``bytes`` in older versions.
     if isinstance(token, bytes):
@@ -23,13 +43,127 @@ def generate_token(user_id: int) -> str:
     return token
 
 
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
 def decode_token(token: str):
     """Decode a JWT token.
     Returns the payload dict if the token is valid, otherwise ``None``.
+    Valid payloads are cached until the earlier of ``TOKEN_CACHE_TTL`` and the token's expiry.
+    Revoked tokens are rejected from the in-memory registry, without a DB round trip.
     """
+    key = _token_key(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        return None if registry.is_revoked(payload.get('jti')) else payload
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except Exception:
         # Any error (expired, invalid signature, etc.) results in ``None``
         return None
+
+    if registry.is_revoked(payload.get('jti')):
+        return None
+
+    ttl = TOKEN_CACHE_TTL
+    if 'exp' in payload:
+        ttl = min(ttl, payload['exp'] - time.time())
+    if ttl > 0:
+        token_cache.set(key, payload, ttl=ttl)
+    return payload
+
+
+def _legacy_user_id():
+    header = request.headers.get('User-Id')
+    try:
+        return int(header)
+    except (TypeError, ValueError):
+        return None
+
+
+def authenticate_request():
+    """Resolve the bearer token once per request.
+    Sets ``g.user_id`` and ``request.user_id`` (``None`` when unauthenticated;
+    see ``ALLOW_USER_ID_HEADER`` for the development-only fallback).
+    """
+    if 'user_id' in g:
+        return g.user_id
+
+    user_id = None
+    payload = None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        payload = decode_token(header[len('Bearer '):].strip())
+        if payload:
+            user_id = payload.get('user_id')
+    elif ALLOW_USER_ID_HEADER:
+        user_id = _legacy_user_id()
+
+    g.token = payload
+    g.user_id = user_id
+    request.user_id = user_id
+    return user_id
+
+
+def init_auth(app):
+    """Install the request-identity middleware for every blueprint.
+    Also loads the revocation set, which a background thread keeps current,
+    so requests only ever check it in memory.
+    """
+    registry.start()
+
+    @app.before_request
+    def _identify():
+        # before_request handlers must return None to let the view run
+        authenticate_request()
+
+
+# Token each Socket.IO connection authenticated with, by sid
+_socket_tokens = {}
+
+
+def authenticate_socket(sid, auth=None):
+    """Remember the bearer token a Socket.IO client connected with.
+    Taken from the connect payload (``io(url, { auth: { token } })``) or the
+    ``Authorization`` header of the handshake. Returns the user id or ``None``.
+    """
+    token = (auth or {}).get('token')
+    header = request.headers.get('Authorization', '')
+    if not token and header.startswith('Bearer '):
+        token = header[len('Bearer '):].strip()
+    if token:
+        _socket_tokens[sid] = token
+    return socket_user_id(sid)
+
+
+def socket_user_id(sid):
+    """Verified user id of a Socket.IO connection.
+    Checked on every call (cached, like HTTP requests), so a token that expires
+    or is revoked after connecting stops working. ``None`` when unauthenticated.
+    """
+    token = _socket_tokens.get(sid)
+    payload = decode_token(token) if token else None
+    return payload.get('user_id') if payload else None
+
+
+def forget_socket(sid):
+    _socket_tokens.pop(sid, None)
+
+
+def login_required(f):
+    """Reject the request with 401 unless it carries a valid bearer token."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if authenticate_request() is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+def current_user_id():
+    """Verified user id of the request, or ``None``.
+    Never guesses a user: routes that need one are ``login_required``.
+    """
+    return authenticate_request()
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Circuit breaker for calls to a flaky dependency
+"""
+
+import threading
+import time
+from typing import Dict
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open, allow() is
+    False and callers should answer with their fallback immediately. After
+    `cooldown` seconds a single trial call is let through (half-open). Its
+    success closes the breaker; its failure opens it for another cooldown.
+    Thread-safe; counts transitions and rejected calls for monitoring.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CLOSED
+        self._trial_started = 0.0
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether to make the call now (claims the trial slot when half-open)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            # One trial at a time; a trial that never reports back frees the slot after a cooldown
+            if self._state == OPEN and now - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+                self._trial_started = now
+                return True
+            if self._state == HALF_OPEN and now - self._trial_started >= self.cooldown:
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.threshold:
+                if self._state != OPEN:
+                    self.opens += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        state = self.state
+        return {
+            'state': state,
+            'consecutive_failures': self._failures,
+            'opens': self.opens,
+            'rejected': self.rejected,
+        }
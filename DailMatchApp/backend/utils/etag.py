@@ -0,0 +1,40 @@
+"""
+Conditional GET
+Strong ETags built from version counters, so an unchanged resource is answered
+with 304 before any rows are fetched or serialized.
+"""
+
+from typing import Optional
+
+from flask import request, current_app
+
+# Content-codings utils.responses may apply; each encoded body gets its own tag
+CODINGS = ('br', 'gzip')
+
+
+def make_etag(kind: str, *parts) -> str:
+    """e.g. make_etag('profile', 5, 3) -> 'profile-5-3' (unquoted)"""
+    return '-'.join([kind] + [str(p) for p in parts])
+
+
+def encoded_etag(etag: str, coding: str) -> str:
+    return f"{etag}-{coding}"
+
+
+def not_modified(etag: str):
+    """The 304 response if the client's If-None-Match already has etag, else None"""
+    candidates = [etag] + [encoded_etag(etag, coding) for coding in CODINGS]
+    matched = next((tag for tag in candidates if tag in request.if_none_match), None)
+    if matched is None:
+        return None
+    response = current_app.response_class(status=304)
+    response.vary.add('Accept-Encoding')
+    return with_etag(response, matched)
+
+
+def with_etag(response, etag: Optional[str]):
+    """Tag a response; clients must revalidate, but may reuse it on a 304"""
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
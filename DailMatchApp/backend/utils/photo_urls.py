@@ -0,0 +1,105 @@
+"""
+Photo URLs
+Profiles store canonical photo references (the upload's file name, or an
+external http(s) URL); public URLs are built from them here, once per
+reference, behind an LRU cache.
+
+PHOTO_BASE_URL points the URLs at a CDN or other public prefix (default: this
+server's /api/user/uploads). With PHOTO_URL_SECRET set, URLs are signed and
+expire: the expiry is rounded to PHOTO_URL_TTL windows so a URL stays stable
+(and cacheable) for at least one window.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from functools import lru_cache
+from typing import Iterable, List, Optional
+from urllib.parse import quote, unquote
+
+from flask import request
+
+PHOTO_BASE_URL = os.environ.get('PHOTO_BASE_URL', '').rstrip('/')
+PHOTO_URL_SECRET = os.environ.get('PHOTO_URL_SECRET', '')
+PHOTO_URL_TTL = int(os.environ.get('PHOTO_URL_TTL', 3600))
+
+UPLOADS_PATH = '/api/user/uploads/'
+
+# Renditions built by services/image_pipeline.py, served under /uploads/<size>/
+SIZES = ('thumb', 'feed', 'full')
+
+
+def is_external(ref: str) -> bool:
+    return ref.startswith(('http://', 'https://'))
+
+
+def canonical_ref(url: str) -> str:
+    """Reference to store for url: our own upload URLs (any host, signed or not) become the file name"""
+    if not is_external(url):
+        return url
+    if PHOTO_BASE_URL and url.startswith(PHOTO_BASE_URL + '/'):
+        ref = url[len(PHOTO_BASE_URL) + 1:]
+    elif UPLOADS_PATH in url:
+        ref = url.split(UPLOADS_PATH, 1)[1]
+    else:
+        return url
+    ref = unquote(ref.split('?', 1)[0])
+    size, _, rest = ref.partition('/')
+    return rest if size in SIZES and rest else ref
+
+
+def signature(ref: str, expires: int) -> str:
+    message = f"{ref}:{expires}".encode('utf-8')
+    return hmac.new(PHOTO_URL_SECRET.encode('utf-8'), message, hashlib.sha256).hexdigest()[:32]
+
+
+def verify(ref: str, expires: Optional[str], sig: Optional[str]) -> bool:
+    """Check a signed URL's query parameters (always True when signing is off)"""
+    if not PHOTO_URL_SECRET:
+        return True
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(signature(ref, expires), sig or '')
+
+
+def _base_url() -> str:
+    if PHOTO_BASE_URL:
+        return PHOTO_BASE_URL
+    return request.host_url.rstrip('/') + UPLOADS_PATH.rstrip('/')
+
+
+@lru_cache(maxsize=8192)
+def _build(base: str, ref: str, expires: int) -> str:
+    url = f"{base}/{quote(ref)}"
+    if expires:
+        url += f"?expires={expires}&sig={signature(ref, expires)}"
+    return url
+
+
+def url_epoch() -> int:
+    """Signing window URLs are currently built for (0 when unsigned); part of
+    the ETag of any response that embeds photo URLs"""
+    if not PHOTO_URL_SECRET:
+        return 0
+    return int(time.time()) // PHOTO_URL_TTL
+
+
+def photo_url(ref: str, size: Optional[str] = None) -> str:
+    """Public URL for a stored photo reference, optionally a rendition ('thumb', 'feed', 'full')"""
+    if is_external(ref):
+        return ref
+    if size:
+        ref = f"{size}/{ref}"
+    epoch = url_epoch()
+    # Signed URLs are valid for between one and two windows; identical within a window
+    expires = (epoch + 2) * PHOTO_URL_TTL if epoch else 0
+    return _build(_base_url(), ref, expires)
+
+
+def photo_urls(refs: Iterable[str], size: Optional[str] = None) -> List[str]:
+    return [photo_url(ref, size) for ref in refs]
@@ -0,0 +1,253 @@
+"""
+Rate limiting
+Token buckets per (policy, client), applied to REST routes and Socket.IO events
+
+Policies are "<requests>/<seconds>" and can be overridden per policy with
+RATE_LIMIT_<NAME>, e.g. RATE_LIMIT_SWIPE=60/60. Buckets live in process
+memory; set RATE_LIMIT_DB to a SQLite file path to share them between
+workers on the same host.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import request, jsonify, g
+from flask_socketio import emit
+
+DEFAULT_POLICIES = {
+    'login': '10/60',          # per IP
+    'signup': '5/300',         # per IP
+    'swipe': '120/60',         # per user
+    'send_message': '20/10',   # per socket connection
+    'ai': '10/60',             # per socket connection (streamed AI generations)
+}
+
+# Buckets untouched this long are dropped (they'd be full again anyway)
+IDLE_SECONDS = 600
+EVICT_INTERVAL = 60
+
+
+def _parse(spec: str) -> Tuple[float, float]:
+    """'10/60' -> (capacity 10, refill 10/60 tokens per second)"""
+    count, seconds = spec.split('/')
+    capacity = float(count)
+    return capacity, capacity / float(seconds)
+
+
+class MemoryStore:
+    """Buckets in a dict: O(1) per check, idle buckets swept periodically"""
+
+    def __init__(self):
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + EVICT_INTERVAL
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        """Consume one token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _sweep(self, now: float) -> None:
+        cutoff = now - IDLE_SECONDS
+        for key in [k for k, b in self._buckets.items() if b[1] < cutoff]:
+            del self._buckets[key]
+        self._next_sweep = now + EVICT_INTERVAL
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SqliteStore:
+    """Buckets in a small SQLite file so every worker on the host sees the same counts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._next_sweep = time.time() + EVICT_INTERVAL
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        # Wall clock, since monotonic clocks aren't shared across processes
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now >= self._next_sweep:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - IDLE_SECONDS,))
+                self._next_sweep = now + EVICT_INTERVAL
+
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    def __init__(self, store=None, policies: Optional[Dict[str, str]] = None):
+        self.store = store or MemoryStore()
+        self.policies = {}
+        for name, spec in {**DEFAULT_POLICIES, **(policies or {})}.items():
+            spec = os.environ.get(f"RATE_LIMIT_{name.upper()}", spec)
+            self.policies[name] = _parse(spec)
+        self.allowed = Counter()
+        self.rejected = Counter()
+
+    def hit(self, policy: str, key) -> float:
+        """Record one request; returns 0 if allowed, else the Retry-After in seconds"""
+        capacity, rate = self.policies[policy]
+        retry_after = self.store.take(f"{policy}:{key}", capacity, rate)
+        if retry_after:
+            self.rejected[policy] += 1
+        else:
+            self.allowed[policy] += 1
+        return retry_after
+
+    def stats(self) -> Dict:
+        return {
+            'buckets': len(self.store),
+            'allowed': dict(self.allowed),
+            'rejected': dict(self.rejected),
+        }
+
+
+limiter = RateLimiter(SqliteStore(os.environ['RATE_LIMIT_DB']) if os.environ.get('RATE_LIMIT_DB') else None)
+
+
+# Only honour X-Forwarded-For behind a proxy that sets it; clients can forge it
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS') == '1'
+
+
+def client_ip() -> str:
+    forwarded = request.headers.get('X-Forwarded-For', '') if TRUST_PROXY_HEADERS else ''
+    return forwarded.split(',')[0].strip() if forwarded else (request.remote_addr or 'unknown')
+
+
+def _key(by: str) -> str:
+    if by == 'user':
+        # Verified identity from the auth middleware, else the caller's IP
+        user_id = g.get('user_id') or getattr(request, 'user_id', None)
+        if user_id is not None:
+            return f"user:{user_id}"
+    if by == 'sid':
+        return f"sid:{request.sid}"
+    return f"ip:{client_ip()}"
+
+
+def rate_limit(policy: str, by: str = 'ip'):
+    """Reject a REST route with 429 + Retry-After once the client's bucket is empty"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            retry_after = limiter.hit(policy, _key(by))
+            if retry_after:
+                response = jsonify({'error': 'Too many requests, slow down'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(int(retry_after) + 1)
+                return response
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def socket_rate_limit(policy: str, by: str = 'sid'):
+    """Drop a Socket.IO event (and tell the client) once its bucket is empty"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            retry_after = limiter.hit(policy, _key(by))
+            if retry_after:
+                emit('rate_limited', {'event': policy, 'retryAfter': round(retry_after, 1)})
+                return None
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+class LoginBackoff:
+    """
+    Per-account exponential backoff on failed logins: after FREE_ATTEMPTS
+    failures, each further failure doubles the lockout (capped at MAX_DELAY).
+    """
+
+    FREE_ATTEMPTS = 3
+    BASE_DELAY = 2
+    MAX_DELAY = 15 * 60
+
+    def __init__(self):
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, account: str) -> float:
+        """Seconds the account must still wait before another attempt (0 if none)"""
+        with self._lock:
+            entry = self._failures.get(account.lower())
+        if not entry:
+            return 0.0
+        return max(0.0, entry[1] - time.monotonic())
+
+    def failure(self, account: str) -> None:
+        account = account.lower()
+        now = time.monotonic()
+        with self._lock:
+            count = self._failures.get(account, (0, now))[0] + 1
+            delay = 0.0
+            if count > self.FREE_ATTEMPTS:
+                delay = min(self.MAX_DELAY, self.BASE_DELAY * 2 ** (count - self.FREE_ATTEMPTS - 1))
+            self._failures[account] = (count, now + delay)
+            # Keep the map bounded: forget accounts whose lockout is long over
+            if len(self._failures) > 10000:
+                cutoff = now - self.MAX_DELAY
+                for key in [k for k, v in self._failures.items() if v[1] < cutoff]:
+                    del self._failures[key]
+
+    def success(self, account: str) -> None:
+        with self._lock:
+            self._failures.pop(account.lower(), None)
+
+
+login_backoff = LoginBackoff()
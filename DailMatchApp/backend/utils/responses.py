@@ -0,0 +1,213 @@
+"""
+Response layer
+Faster JSON encoding and gzip/brotli compression for Flask responses and
+Socket.IO payloads.
+
+orjson and brotli are optional: without orjson the stdlib encoder is used,
+without brotli only gzip is offered. Bodies under COMPRESS_MIN_SIZE go out
+as-is, since compressing a few hundred bytes costs more than it saves.
+"""
+
+import gzip
+import json
+import os
+from typing import Optional
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+from utils.etag import CODINGS, encoded_etag
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+# Quality 4-5 is the usual sweet spot for on-the-fly brotli; 11 is for static assets
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+COMPRESSIBLE_TYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+# Most preferred first, when the client accepts several equally
+AVAILABLE_CODINGS = [c for c in CODINGS if c != 'br' or brotli]
+
+
+class FastJSON:
+    """json-module lookalike (dumps/loads) for python-socketio"""
+
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        # Socket.IO asks for compact separators, which orjson always uses
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj).decode('utf-8')
+            except (TypeError, orjson.JSONEncodeError):
+                pass
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+
+fast_json = FastJSON
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson when installed. Dates, decimals,
+    dataclasses etc. still go through Flask's default hook, so the output
+    matches the stdlib provider (apart from whitespace and \\u escaping).
+    """
+
+    def _orjson_options(self, indent: bool = False) -> int:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _dump_bytes(self, obj, indent: bool = False) -> Optional[bytes]:
+        """orjson output, or None when the stdlib encoder has to take over"""
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options(indent))
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers beyond 64 bits
+            return None
+
+    def dumps(self, obj, **kwargs) -> str:
+        if not kwargs:
+            data = self._dump_bytes(obj)
+            if data is not None:
+                return data.decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        data = self._dump_bytes(obj, indent)
+        if data is None:
+            return super().response(obj)
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output deterministic, so strong ETags stay honest
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """Best coding both sides support ('br', 'gzip'), or None"""
+    return accept_encodings.best_match(AVAILABLE_CODINGS)
+
+
+def compress_response(response):
+    """after_request hook: compress sizeable text/JSON bodies the client can decode"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if response.content_length is None or response.content_length < COMPRESS_MIN_SIZE:
+        return response
+
+    coding = negotiate(request.accept_encodings)
+    if not coding:
+        return response
+
+    response.set_data(compress(response.get_data(), coding))
+    response.headers['Content-Encoding'] = coding
+
+    # The compressed body is a different representation: give it its own strong tag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, coding))
+    return response
+
+
+def init_responses(app):
+    """Install the fast JSON provider and response compression."""
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+
+
+def socketio_options() -> dict:
+    """Keyword arguments for SocketIO(): same encoder, and compressed polling payloads.
+    WebSocket frames are compressed by permessage-deflate, which eventlet
+    negotiates on its own when the client offers it."""
+    return {
+        'json': fast_json,
+        'http_compression': True,
+        'compression_threshold': COMPRESS_MIN_SIZE,
+    }
+
+
+# Encoder and compression cost on representative payloads
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    # Varied text so the compression ratios are realistic
+    rng = random.Random(7)
+    words = ('coffee hike dog brunch movie beach travel music pizza weekend '
+             'sunset book museum concert tacos yoga city road trip art').split()
+
+    def text(n):
+        return ' '.join(rng.choice(words) for _ in range(n)).capitalize()
+
+    def profile(user_id):
+        return {
+            'id': user_id, 'name': f'User {user_id}', 'age': rng.randint(21, 40), 'bio': text(25),
+            'occupation': text(2), 'education': text(3), 'height': f"5'{rng.randint(0, 11)}",
+            'location': text(1),
+            'photos': [f'https://api.example.com/api/user/uploads/{user_id}_{rng.getrandbits(32)}_photo.jpg'
+                       for _ in range(4)],
+            'prompts': [{'question': text(5), 'answer': text(12)} for _ in range(3)],
+        }
+
+    def history(n):
+        return [{'id': 100000 + i, 'senderId': rng.choice((42, 7)), 'receiverId': 7, 'text': text(rng.randint(3, 20)),
+                 'timestamp': f'2026-01-15 19:{i // 60 % 60:02d}:{i % 60:02d}', 'status': 'read'}
+                for i in range(n)]
+
+    payloads = {
+        'profile': {'profile': profile(42)},
+        'potential matches (20)': {'matches': [profile(i) for i in range(20)]},
+        'chat history (50)': history(50),
+        'chat history (500)': history(500),
+    }
+
+    print(f"orjson: {'yes' if orjson else 'no'}, brotli: {'yes' if brotli else 'no'}")
+    for name, obj in payloads.items():
+        n = 200
+        stdlib = timeit.timeit(lambda: json.dumps(obj, sort_keys=True, separators=(',', ':')), number=n) / n
+        fast = timeit.timeit(lambda: FastJSON.dumps(obj), number=n) / n
+        data = FastJSON.dumps(obj).encode('utf-8')
+        line = f"{name:24} {len(data):>7}B  json {stdlib * 1e6:7.0f}us -> {fast * 1e6:6.0f}us"
+        for coding in AVAILABLE_CODINGS:
+            took = timeit.timeit(lambda: compress(data, coding), number=n) / n
+            line += f"  {coding} {len(compress(data, coding)):>6}B {took * 1e6:5.0f}us"
+        print(line)
@@ -0,0 +1,161 @@
+"""
+Session registry and token revocation
+
+Every issued JWT carries a ``jti`` recorded in the ``sessions`` table.
+Revoked, unexpired jtis are mirrored in memory (a Bloom filter in front of an
+exact set), so checking a token on an authenticated request never touches the
+database. The set is loaded once at startup (init_auth calls start()); a
+background thread then picks up revocations made by other workers with a
+cheap incremental reload every REVOCATION_REFRESH seconds, prunes expired
+entries, and purges expired rows from the table every SESSION_PURGE_INTERVAL.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from models.database import get_db
+
+REVOCATION_REFRESH = float(os.environ.get('REVOCATION_REFRESH', 10))
+SESSION_PURGE_INTERVAL = float(os.environ.get('SESSION_PURGE_INTERVAL', 3600))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives)"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        # Double hashing: h1 + i*h2 gives k independent-enough positions
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SessionRegistry:
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, float] = {}  # jti -> token expiry (unix time)
+        self._bloom = BloomFilter(capacity)
+        self._last_revoked_at = 0.0
+        self._next_purge = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    # --- writes (login / logout / password reset) ---
+
+    def register(self, jti: str, user_id: int, expires_at: float) -> None:
+        with get_db() as conn:
+            conn.execute("""
+                INSERT INTO sessions (jti, user_id, issued_at, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (jti, user_id, time.time(), expires_at))
+
+    def revoke(self, jti: str) -> None:
+        """Revoke a single session (logout)"""
+        now = time.time()
+        with get_db() as conn:
+            row = conn.execute("SELECT expires_at FROM sessions WHERE jti = ?", (jti,)).fetchone()
+            conn.execute("UPDATE sessions SET revoked_at = ? WHERE jti = ? AND revoked_at IS NULL", (now, jti))
+        self._add(jti, row['expires_at'] if row else now + 24 * 3600)
+
+    def revoke_user(self, user_id: int) -> int:
+        """Revoke every live session of a user (password reset, 'log out everywhere')"""
+        now = time.time()
+        with get_db() as conn:
+            rows = conn.execute("""
+                SELECT jti, expires_at FROM sessions
+                WHERE user_id = ? AND revoked_at IS NULL AND expires_at > ?
+            """, (user_id, now)).fetchall()
+            conn.execute("""
+                UPDATE sessions SET revoked_at = ?
+                WHERE user_id = ? AND revoked_at IS NULL
+            """, (now, user_id))
+        for row in rows:
+            self._add(row['jti'], row['expires_at'])
+        return len(rows)
+
+    def _add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._bloom.add(jti)
+
+    # --- reads (every authenticated request) ---
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """Memory only; kept current by the background refresh (see start())"""
+        if not jti:
+            return False
+        # Almost every token misses the Bloom filter, so no set lookup at all
+        if jti not in self._bloom:
+            return False
+        return jti in self._revoked
+
+    # --- background maintenance ---
+
+    def start(self) -> None:
+        """Load the revocation set now, then keep it fresh on a daemon thread"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="session-registry", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(REVOCATION_REFRESH)
+            self.refresh()
+
+    def refresh(self) -> None:
+        """Pull revocations made by other workers; prune expired ones"""
+        now = time.time()
+        try:
+            with get_db() as conn:
+                if now >= self._next_purge:
+                    conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                    self._next_purge = now + SESSION_PURGE_INTERVAL
+                rows = conn.execute("""
+                    SELECT jti, expires_at, revoked_at FROM sessions
+                    WHERE revoked_at IS NOT NULL AND revoked_at >= ? AND expires_at > ?
+                """, (self._last_revoked_at, now)).fetchall()
+        except Exception as e:
+            print(f"Session registry refresh failed: {e}")
+            return
+
+        with self._lock:
+            for row in rows:
+                self._revoked[row['jti']] = row['expires_at']
+                self._bloom.add(row['jti'])
+                self._last_revoked_at = max(self._last_revoked_at, row['revoked_at'])
+
+            expired = [jti for jti, exp in self._revoked.items() if exp <= now]
+            for jti in expired:
+                del self._revoked[jti]
+            # Bloom filters can't delete; rebuild once pruning or growth warrants it
+            if expired or len(self._revoked) > self.capacity:
+                self.capacity = max(self.capacity, len(self._revoked) * 2)
+                self._bloom = BloomFilter(self.capacity)
+                for jti in self._revoked:
+                    self._bloom.add(jti)
+
+    def stats(self) -> Dict[str, int]:
+        return {'revoked': len(self._revoked)}
+
+
+registry = SessionRegistry()
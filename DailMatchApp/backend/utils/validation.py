@@ -11,9 +11,13 @@ from datetime import datetime
 EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
 
 # Allowed file extensions for uploads
-ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'heic'}
+ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic'}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
+# How much of a file sniff_image_type needs to see
+SNIFF_BYTES = 16
+HEIC_BRANDS = {b'heic', b'heix', b'hevc', b'heim', b'heis', b'mif1', b'msf1'}
+
 # Text length limits
 MAX_NAME_LENGTH = 100
 MAX_BIO_LENGTH = 500
@@ -191,6 +195,29 @@ def validate_file_size(file_size: int, max_size: int = MAX_FILE_SIZE) -> Tuple[b
     return True, ""
 
 
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image type from a file's first SNIFF_BYTES bytes, as an extension ('jpg', 'png', ...)"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in HEIC_BRANDS:
+        return 'heic'
+    return None
+
+
+def validate_file_content(head: bytes, allowed_extensions: set = ALLOWED_IMAGE_EXTENSIONS) -> Tuple[bool, str]:
+    """Validate that a file's leading bytes are an allowed image type (whatever its name says)"""
+    if sniff_image_type(head) not in allowed_extensions:
+        return False, "File is not a supported image"
+    
+    return True, ""
+
+
 def sanitize_text(text: str) -> str:
     """
     Sanitize text input to prevent XSS
@@ -0,0 +1,112 @@
+"""
+Wire encodings for chat events
+Clients pick one at connect time; JSON objects stay the default
+"""
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the 'msgpack' encoding
+    msgpack = None
+
+# Positional layout used by the compact encodings
+MESSAGE_FIELDS = ('_id', 'text', 'senderId', 'timestamp', 'status', 'imageUrl')
+STATUSES = ('sent', 'read')
+
+DEFAULT_ENCODING = 'json'
+ENCODINGS = ('json', 'compact', 'msgpack') if msgpack else ('json', 'compact')
+
+# Negotiated encoding per Socket.IO session id
+_encodings = {}
+
+
+def negotiate(sid, requested):
+    """Record the encoding for a connection, falling back to JSON if unsupported"""
+    encoding = requested if requested in ENCODINGS else DEFAULT_ENCODING
+    if encoding != DEFAULT_ENCODING:
+        _encodings[sid] = encoding
+    return encoding
+
+
+def forget(sid):
+    _encodings.pop(sid, None)
+
+
+def encoding_for(sid):
+    return _encodings.get(sid, DEFAULT_ENCODING)
+
+
+def room_for(room, encoding):
+    """Per-encoding sub-room, so room broadcasts can be encoded once per format"""
+    return f"{room}#{encoding}"
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _to_row(message):
+    status = message.get('status')
+    return [
+        _as_int(message['_id']),
+        message.get('text'),
+        _as_int(message.get('senderId')),
+        message.get('timestamp'),
+        STATUSES.index(status) if status in STATUSES else None,
+        message.get('imageUrl'),
+    ]
+
+
+def _finish(payload, encoding):
+    if encoding == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True)
+    return payload
+
+
+def encode_messages(messages, encoding):
+    """
+    Encode a list of serialized messages
+
+    json:    unchanged list of objects
+    compact: {'f': field names, 'r': [[id, text, senderId, timestamp, status, imageUrl], ...]}
+    msgpack: the compact table packed to bytes
+    """
+    if encoding == DEFAULT_ENCODING:
+        return messages
+    return _finish({'f': MESSAGE_FIELDS, 'r': [_to_row(m) for m in messages]}, encoding)
+
+
+def encode_batch(payload, encoding):
+    """Encode a dict payload whose 'messages' key holds a list of messages"""
+    if encoding == DEFAULT_ENCODING:
+        return payload
+    compact = dict(payload)
+    compact['messages'] = {'f': MESSAGE_FIELDS, 'r': [_to_row(m) for m in payload['messages']]}
+    return _finish(compact, encoding)
+
+
+def encode_message(message, encoding):
+    """Encode a single message as an object (json) or a positional row"""
+    if encoding == DEFAULT_ENCODING:
+        return message
+    return _finish(_to_row(message), encoding)
+
+
+# Quick size comparison when running this file directly
+if __name__ == '__main__':
+    import json
+
+    history = [{
+        '_id': str(i),
+        'text': 'See you at the coffee place at 7?',
+        'senderId': str(10 + i % 2),
+        'timestamp': '2024-05-01 18:30:00',
+        'status': 'read'
+    } for i in range(1000)]
+
+    print(f"json:    {len(json.dumps(history))} bytes")
+    print(f"compact: {len(json.dumps(encode_messages(history, 'compact')))} bytes")
+    if msgpack:
+        print(f"msgpack: {len(encode_messages(history, 'msgpack'))} bytes")
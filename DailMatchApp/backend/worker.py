@@ -0,0 +1,60 @@
+"""
+JOB WORKER
+Runs background jobs (services/jobs.py) outside the web process
+
+Usage:
+    python worker.py [--types image.renditions,photos.collect] [--workers 2] [--once]
+    python worker.py --enqueue photos.collect [--payload '{"grace_seconds": 0}']
+    python worker.py --requeue-dead [--types ...]
+"""
+
+import argparse
+import json
+import signal
+import sys
+import threading
+
+from models.database import init_db
+from services import job_queue, jobs  # noqa: F401 (registers the handlers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run DailyMatch background jobs')
+    parser.add_argument('--types', help='Comma-separated job types to run (default: all)')
+    parser.add_argument('--workers', type=int, default=2, help='Worker threads')
+    parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls when idle')
+    parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit')
+    parser.add_argument('--enqueue', metavar='TYPE', help='Queue one job and exit')
+    parser.add_argument('--payload', default='{}', help='JSON payload for --enqueue')
+    parser.add_argument('--requeue-dead', action='store_true', help='Retry dead-lettered jobs and exit')
+    args = parser.parse_args()
+
+    init_db()
+    types = args.types.split(',') if args.types else None
+
+    if args.enqueue:
+        print(f"Queued job {job_queue.enqueue(args.enqueue, json.loads(args.payload))}")
+        return
+    if args.requeue_dead:
+        for job_type in types or [None]:
+            print(f"Requeued {job_queue.requeue_dead(job_type)} dead jobs ({job_type or 'all types'})")
+        return
+
+    worker = job_queue.JobWorker(types, workers=args.workers, poll_interval=args.poll)
+    if args.once:
+        print(f"Ran {worker.run_pending(limit=sys.maxsize)} jobs; {job_queue.stats()}")
+        return
+
+    print(f"Worker {worker.name} running {', '.join(types or sorted(job_queue.registry))}")
+    worker.start()
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+    # Wake up now and then: on Windows a bare wait() isn't interrupted by Ctrl+C
+    while not stopped.wait(1.0):
+        pass
+    worker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,7 @@ interface Message {
     senderId: string;
     timestamp: Date;
     status: 'sending' | 'sent' | 'delivered' | 'read';
+    imageUrl?: string; // signed by the server for "[IMAGE]:<ref>" messages
 }
 
 const ChatScreen = ({ route, navigation }: any) => {
@@ -43,7 +44,13 @@ const ChatScreen = ({ route, navigation }: any) => {
     const [currentUserId, setCurrentUserId] = useState<string>('1'); // Default fallback
     const flatListRef = useRef<FlatList>(null);
     const socketRef = useRef<any>(null);
+    const lastMessageIdRef = useRef<string | null>(null);
+    // Older pages come from 'load_history'; prepending them must not scroll to the end
+    const [hasMoreHistory, setHasMoreHistory] = useState(false);
+    const loadingHistoryRef = useRef(false);
+    const keepScrollRef = useRef(false);
     const typingTimeoutRef = useRef<any>(null);
+    const aiRequestRef = useRef<string | null>(null);
 
     // AI Features
     const [suggestions, setSuggestions] = useState<string[]>([]);
@@ -144,9 +151,18 @@ const ChatScreen = ({ route, navigation }: any) => {
         setSuggestions([]);
     };
 
+    const randomIcebreaker = () => ICEBREAKERS[Math.floor(Math.random() * ICEBREAKERS.length)];
+
     const sendIcebreaker = () => {
-        const ib = ICEBREAKERS[Math.floor(Math.random() * ICEBREAKERS.length)];
-        setInputText(ib);
+        if (!socketRef.current?.connected) {
+            setInputText(randomIcebreaker());
+            return;
+        }
+        // Streamed from the server's AI into the input; the built-in list covers errors
+        const requestId = `ib-${Date.now()}`;
+        aiRequestRef.current = requestId;
+        setInputText('');
+        socketRef.current.emit('ai_icebreakers', { requestId, room: match.id });
     };
 
     const handleManualAI = () => {
@@ -171,11 +187,19 @@ const ChatScreen = ({ route, navigation }: any) => {
         // Connect to socket
         socketRef.current = io(SOCKET_URL, {
             transports: ['websocket'],
+            // Read again on every (re)connect; the server acts on this identity
+            auth: (cb: (data: object) => void) => {
+                AsyncStorage.getItem('authToken').then(token => cb({ token }));
+            },
         });
 
         socketRef.current.on('connect', () => {
             console.log('Connected to chat server');
-            socketRef.current.emit('join', { room: match.id });
+            // On reconnect only ask for what we missed
+            socketRef.current.emit('join', {
+                room: match.id,
+                lastMessageId: lastMessageIdRef.current,
+            });
         });
 
         // Listen for chat history
@@ -187,12 +211,58 @@ const ChatScreen = ({ route, navigation }: any) => {
                 senderId: msg.senderId,
                 timestamp: new Date(msg.timestamp),
                 status: msg.status as any,
+                imageUrl: msg.imageUrl || undefined,
             }));
             setMessages(formattedMessages);
+            if (history.length) lastMessageIdRef.current = history[history.length - 1]._id;
             setTimeout(() => flatListRef.current?.scrollToEnd({ animated: false }), 100);
         });
 
+        // A page of older messages (empty right after 'chat_history', which only says if there are more)
+        socketRef.current.on('chat_history_page', (page: { messages: any[]; hasMore: boolean }) => {
+            loadingHistoryRef.current = false;
+            setHasMoreHistory(page.hasMore);
+            if (!page.messages.length) return;
+            const olderMessages: Message[] = page.messages.map(msg => ({
+                id: msg._id,
+                text: msg.text,
+                senderId: msg.senderId,
+                timestamp: new Date(msg.timestamp),
+                status: msg.status as any,
+                imageUrl: msg.imageUrl || undefined,
+            }));
+            keepScrollRef.current = true;
+            setMessages(prev => {
+                const known = new Set(prev.map(m => m.id));
+                return [...olderMessages.filter(m => !known.has(m.id)), ...prev];
+            });
+        });
+
+        // Delta since lastMessageId, sent instead of history on reconnect
+        socketRef.current.on('chat_delta', (delta: { messages: any[]; readUpTo: Record<string, string> }) => {
+            const newMessages: Message[] = delta.messages.map(msg => ({
+                id: msg._id,
+                text: msg.text,
+                senderId: msg.senderId,
+                timestamp: new Date(msg.timestamp),
+                status: msg.status as any,
+                imageUrl: msg.imageUrl || undefined,
+            }));
+            setMessages(prev => {
+                const known = new Set(prev.map(m => m.id));
+                const merged = [...prev, ...newMessages.filter(m => !known.has(m.id))];
+                return merged.map(msg => {
+                    const readUpTo = delta.readUpTo[msg.senderId];
+                    return readUpTo && Number(msg.id) <= Number(readUpTo) ? { ...msg, status: 'read' } : msg;
+                });
+            });
+            if (delta.messages.length) {
+                lastMessageIdRef.current = delta.messages[delta.messages.length - 1]._id;
+            }
+        });
+
         socketRef.current.on('receive_message', (data: any) => {
+            if (data._id) lastMessageIdRef.current = data._id;
             if (data.senderId === currentUserId) return;
 
             const newMessage: Message = {
@@ -201,6 +271,7 @@ const ChatScreen = ({ route, navigation }: any) => {
                 senderId: data.senderId,
                 timestamp: new Date(data.timestamp || Date.now()),
                 status: 'read',
+                imageUrl: data.imageUrl || undefined,
             };
 
             setMessages(prev => {
@@ -229,6 +300,33 @@ const ChatScreen = ({ route, navigation }: any) => {
             setIsTyping(false);
         });
 
+        // AI icebreakers: the first line fills the input as tokens arrive, the rest become suggestions
+        socketRef.current.on('ai_token', (data: { requestId: string; text: string }) => {
+            if (data.requestId !== aiRequestRef.current) return;
+            setInputText(prev => (prev + data.text).split('\n')[0]);
+        });
+
+        socketRef.current.on('ai_icebreakers', (data: { requestId: string; icebreakers: string[] }) => {
+            if (data.requestId !== aiRequestRef.current) return;
+            aiRequestRef.current = null;
+            const [first, ...rest] = data.icebreakers;
+            setInputText(first || randomIcebreaker());
+            setSuggestions(rest);
+        });
+
+        socketRef.current.on('ai_error', (data: { requestId: string }) => {
+            if (data.requestId !== aiRequestRef.current) return;
+            aiRequestRef.current = null;
+            setInputText(randomIcebreaker());
+        });
+
+        socketRef.current.on('rate_limited', (data: { event: string }) => {
+            if (data.event === 'ai' && aiRequestRef.current) {
+                aiRequestRef.current = null;
+                setInputText(randomIcebreaker());
+            }
+        });
+
         // Read receipts
         socketRef.current.on('message_read', (data: any) => {
             setMessages(prev => prev.map(msg =>
@@ -244,7 +342,13 @@ const ChatScreen = ({ route, navigation }: any) => {
         };
     }, [match.id, currentUserId]);
 
-    const handleSend = (textOverride?: string) => {
+    const loadOlderMessages = () => {
+        if (!hasMoreHistory || loadingHistoryRef.current || !socketRef.current?.connected) return;
+        loadingHistoryRef.current = true;
+        socketRef.current.emit('load_history', { room: match.id, beforeId: messages[0]?.id });
+    };
+
+    const handleSend = (textOverride?: string, imageUrl?: string) => {
         const textToSend = typeof textOverride === 'string' ? textOverride : inputText.trim();
         if (!textToSend) return;
 
@@ -254,6 +358,7 @@ const ChatScreen = ({ route, navigation }: any) => {
             senderId: currentUserId,
             timestamp: new Date(),
             status: 'sending',
+            imageUrl,
         };
 
         setMessages(prev => [...prev, newMessage]);
@@ -358,7 +463,8 @@ const ChatScreen = ({ route, navigation }: any) => {
         const showDateHeader = shouldShowDateHeader(item, previousMessage);
 
         const isImage = item.text.startsWith('[IMAGE]:');
-        const imageUrl = isImage ? `${SOCKET_URL}/api/user/uploads/${item.text.replace('[IMAGE]:', '')}` : null;
+        // Built (and signed) by the server: PHOTO_BASE_URL / PHOTO_URL_SECRET apply
+        const imageUrl = isImage ? item.imageUrl ?? null : null;
 
         return (
             <View>
@@ -382,7 +488,7 @@ const ChatScreen = ({ route, navigation }: any) => {
                         <View style={[styles.messageBubble, isMe ? styles.myMessage : styles.theirMessage, isImage && { padding: 5, backgroundColor: isMe ? '#000000' : '#FFF' }]}>
                             {isImage ? (
                                 <Image
-                                    source={{ uri: imageUrl! }}
+                                    source={imageUrl ? { uri: imageUrl } : undefined}
                                     style={{ width: 200, height: 250, borderRadius: 10, backgroundColor: '#EEE' }}
                                     resizeMode="cover"
                                 />
@@ -452,7 +558,7 @@ const ChatScreen = ({ route, navigation }: any) => {
             try {
                 const uploadRes = await userAPI.uploadImage(photo);
                 if (uploadRes.success) {
-                    handleSend(`[IMAGE]:${uploadRes.filename}`);
+                    handleSend(`[IMAGE]:${uploadRes.filename}`, uploadRes.url);
                 } else {
                     Alert.alert('Upload Failed');
                 }
@@ -475,7 +581,7 @@ const ChatScreen = ({ route, navigation }: any) => {
             try {
                 const uploadRes = await userAPI.uploadImage(photo);
                 if (uploadRes.success) {
-                    handleSend(`[IMAGE]:${uploadRes.filename}`);
+                    handleSend(`[IMAGE]:${uploadRes.filename}`, uploadRes.url);
                 } else {
                     Alert.alert('Upload Failed');
                 }
@@ -554,8 +660,19 @@ const ChatScreen = ({ route, navigation }: any) => {
                     renderItem={renderMessage}
                     keyExtractor={item => item.id}
                     contentContainerStyle={styles.messagesList}
-                    onContentSizeChange={() => flatListRef.current?.scrollToEnd()}
+                    onContentSizeChange={() => {
+                        if (keepScrollRef.current) {
+                            keepScrollRef.current = false;
+                            return;
+                        }
+                        flatListRef.current?.scrollToEnd();
+                    }}
                     showsVerticalScrollIndicator={false}
+                    ListHeaderComponent={hasMoreHistory ? (
+                        <TouchableOpacity style={styles.loadEarlierButton} onPress={loadOlderMessages}>
+                            <Text style={styles.loadEarlierText}>Load earlier messages</Text>
+                        </TouchableOpacity>
+                    ) : null}
                     ListEmptyComponent={() => (
                         <View style={styles.emptyContainer}>
                             <Text style={styles.emptyText}>Start the conversation!</Text>
@@ -1027,6 +1144,16 @@ const styles = StyleSheet.create({
         marginHorizontal: 16,
     },
     // AI Styles
+    loadEarlierButton: {
+        alignSelf: 'center',
+        paddingVertical: 8,
+        paddingHorizontal: 16,
+        marginBottom: 8,
+    },
+    loadEarlierText: {
+        fontSize: 13,
+        color: '#999',
+    },
     emptyContainer: {
         alignItems: 'center',
         paddingVertical: 40,